@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.generate_dataset import generate
+
+# Load generator for the ingest server. Each virtual device replays one recorded
+# (or synthetic) night against /sensorData, /sleepEvent and /groundTruth, sending
+# one request at a time like the ESP32 firmware, with the night's timing
+# compressed by --speedup:
+#   python -m benchmarks.fleet_simulator --url http://localhost:6543 --devices 50 --speedup 600
+#   python -m benchmarks.fleet_simulator --in-process --synthetic 20 --devices 200 --speedup 3600
+
+EVENT_CODES = {"LIGHT": 0, "SOUND": 1, "MOVEMENT": 2}
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")]
+
+
+def parse_time(value):
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def read_rows(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def load_schedule(night_dir):
+    # Returns [(seconds since first row, path, json body)] for one night
+    requests = []
+    for row in read_rows(os.path.join(night_dir, "sensor_data_log.csv")):
+        body = {key: float(row[key]) for key in ("temperature", "humidity", "heat_index")}
+        body.update({key: int(float(row[key])) for key in ("light", "sound")})
+        requests.append((parse_time(row["timestamp"]), "/sensorData", body))
+    for row in read_rows(os.path.join(night_dir, "sleep_event_log.csv")):
+        requests.append((parse_time(row["timestamp"]), "/sleepEvent", {"sleepEvent": EVENT_CODES[row["sleep_event"]]}))
+    for row in read_rows(os.path.join(night_dir, "ground_truth_log.csv")):
+        requests.append((parse_time(row["timestamp"]), "/groundTruth", None))
+
+    requests.sort(key=lambda request: request[0])
+    if not requests:
+        return []
+    start = requests[0][0]
+    return [(when - start, path, body) for when, path, body in requests]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lag = []
+
+    def report(self, elapsed):
+        total = sum(len(values) for values in self.latencies.values())
+        errors = sum(self.errors.values())
+        print(f"\n{total} requests in {elapsed:.2f} s ({total / elapsed:.1f} req/s), "
+              f"{errors} errors ({100 * errors / max(total, 1):.2f}%)")
+        if self.lag:
+            print(f"Schedule lag: p50 {np.percentile(self.lag, 50) * 1000:.1f} ms, "
+                  f"p99 {np.percentile(self.lag, 99) * 1000:.1f} ms, max {max(self.lag) * 1000:.1f} ms")
+
+        for path, values in sorted(self.latencies.items()):
+            values = np.asarray(values) * 1000
+            print(f"\n{path}: {len(values)} requests, {self.errors[path]} errors, "
+                  f"p50 {np.percentile(values, 50):.2f} ms, p90 {np.percentile(values, 90):.2f} ms, "
+                  f"p99 {np.percentile(values, 99):.2f} ms, max {values.max():.2f} ms")
+            counts, _ = np.histogram(values, bins=[0, *HISTOGRAM_BUCKETS_MS])
+            for bound, count in zip(HISTOGRAM_BUCKETS_MS, counts):
+                if count:
+                    label = f"<= {bound:g} ms" if bound != float("inf") else f"> {HISTOGRAM_BUCKETS_MS[-2]:g} ms"
+                    bar = "#" * max(1, int(40 * count / len(values)))
+                    print(f"  {label:>11} {count:8d} {bar}")
+
+
+async def run_device(client, device_id, schedule, speedup, stats, start):
+    # Every virtual device writes its own shard on the server
+    for offset, path, body in schedule:
+        delay = start + offset / speedup - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            stats.lag.append(-delay)
+
+        sent = time.perf_counter()
+        try:
+            if body is None:
+                response = await client.post(path, params={"device_id": device_id})
+            else:
+                response = await client.post(path, json={**body, "device_id": device_id})
+            if response.status_code >= 400:
+                stats.errors[path] += 1
+        except Exception:
+            stats.errors[path] += 1
+        stats.latencies[path].append(time.perf_counter() - sent)
+
+
+async def simulate(client, schedules, devices, speedup, max_requests):
+    stats = Stats()
+    plans = [schedules[i % len(schedules)][:max_requests] for i in range(devices)]
+    start = time.perf_counter()
+    await asyncio.gather(*(run_device(client, f"sim-{i}", plan, speedup, stats, start) for i, plan in enumerate(plans)))
+    stats.report(time.perf_counter() - start)
+    return stats
+
+
+async def main_async(args, nights_root):
+    import httpx
+
+    nights = sorted(name for name in os.listdir(nights_root) if os.path.isdir(os.path.join(nights_root, name)))
+    schedules = [schedule for schedule in (load_schedule(os.path.join(nights_root, night)) for night in nights)
+                 if schedule]
+    if not schedules:
+        raise SystemExit(f"No replayable nights under {nights_root}")
+    print(f"Replaying {len(schedules)} nights on {args.devices} devices at {args.speedup:g}x")
+
+    limits = httpx.Limits(max_connections=args.connections)
+    if args.in_process:
+        # Drive main.app directly, writing into a scratch directory
+        os.environ.setdefault("SLEEP_LOG_LEVEL", "WARNING")
+        import main
+        main.parent_data_dir = tempfile.mkdtemp(prefix="fleet_")
+        main.night = "fleet-simulation"
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://fleet") as client:
+                return await simulate(client, schedules, args.devices, args.speedup, args.max_requests)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        return await simulate(client, schedules, args.devices, args.speedup, args.max_requests)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a fleet of sleep sensors against the ingest server.")
+    parser.add_argument("--url", default="http://localhost:6543")
+    parser.add_argument("--in-process", action="store_true", help="run against main.app without a server")
+    parser.add_argument("--data", default="sleep_data", help="nights to replay")
+    parser.add_argument("--synthetic", type=int, default=0, help="replay N synthetic nights instead of --data")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--speedup", type=float, default=600.0, help="night seconds per wall-clock second")
+    parser.add_argument("--max-requests", type=int, default=None, help="cap on requests per device")
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as scratch:
+            generate(scratch, nights=args.synthetic)
+            asyncio.run(main_async(args, scratch))
+    else:
+        asyncio.run(main_async(args, args.data))
+
+
+if __name__ == "__main__":
+    main()
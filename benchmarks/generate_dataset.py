@@ -0,0 +1,93 @@
+import argparse
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+# Writes a synthetic sleep_data/<night>/ tree in the same CSV schemas the ingest
+# server produces, for benchmarking at sizes the real dataset doesn't reach:
+#   python -m benchmarks.generate_dataset /tmp/bench_data --nights 90 --sample-interval 5 --events-per-hour 60
+
+EVENT_TYPES = np.array(["LIGHT", "SOUND", "MOVEMENT"])
+EVENT_WEIGHTS = [0.2, 0.3, 0.5]
+
+
+def format_times(times):
+    return np.char.replace(np.datetime_as_string(times, unit="s"), "T", " ")
+
+
+def write_csv(path, header, columns):
+    lines = [",".join(header)]
+    lines.extend(",".join(values) for values in zip(*columns))
+    with open(path, "w", newline="") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def generate_night(root, night, rng, sample_interval, events_per_hour):
+    night_dir = os.path.join(root, str(night))
+    os.makedirs(night_dir, exist_ok=True)
+
+    evening = np.datetime64(f"{night}T22:00:00")
+    bed_time = evening + np.timedelta64(int(rng.integers(0, 3 * 3600)), "s")
+    wake_time = bed_time + np.timedelta64(int(rng.integers(6 * 3600, 10 * 3600)), "s")
+    start = bed_time - np.timedelta64(2 * 3600, "s")
+    end = wake_time + np.timedelta64(3600, "s")
+    span = int((end - start) / np.timedelta64(1, "s"))
+
+    # Sensor readings every sample_interval seconds (with a little jitter)
+    base = np.arange(0, span, sample_interval)
+    offsets = base + rng.integers(0, max(1, sample_interval // 4), len(base))
+    times = start + offsets.astype("timedelta64[s]")
+    n = len(times)
+    asleep = (times >= bed_time) & (times <= wake_time)
+    temperature = 68 + np.cumsum(rng.normal(0, 0.05, n)) + rng.normal(0, 0.2, n)
+    humidity = np.clip(55 + np.cumsum(rng.normal(0, 0.1, n)), 20, 95).round()
+    heat_index = temperature - 0.5 + 0.01 * humidity
+    light = np.where(asleep, rng.integers(0, 5, n), rng.integers(50, 400, n))
+    sound = rng.integers(1150, 1400, n)
+    write_csv(os.path.join(night_dir, "sensor_data_log.csv"),
+              ["timestamp", "temperature", "humidity", "heat_index", "light", "sound"],
+              [format_times(times), np.char.mod("%.2f", temperature), np.char.mod("%.1f", humidity),
+               np.char.mod("%.2f", heat_index), light.astype(str), sound.astype(str)])
+
+    # Sleep events as a Poisson process over the logging window
+    event_count = rng.poisson(events_per_hour * span / 3600)
+    event_times = start + np.sort(rng.integers(0, span, event_count)).astype("timedelta64[s]")
+    events = rng.choice(EVENT_TYPES, event_count, p=EVENT_WEIGHTS)
+    write_csv(os.path.join(night_dir, "sleep_event_log.csv"), ["timestamp", "sleep_event"],
+              [format_times(event_times), events])
+
+    write_csv(os.path.join(night_dir, "ground_truth_log.csv"), ["timestamp"],
+              [format_times(np.array([bed_time, wake_time]))])
+
+    latency = int(rng.choice([15, 30, 45, 60, 90, 120, 180, 240]))
+    quality = int(rng.integers(1, 11))
+    duration = round(float((wake_time - bed_time) / np.timedelta64(1, "h")), 1)
+    supplement = " Took melatonin before bed." if rng.random() < 0.3 else ""
+    with open(os.path.join(night_dir, "journal.txt"), "w") as f:
+        f.write(f"Synthetic night.{supplement}\n\n"
+                f"Sleep Onset Latency: {latency} min\nSleep Quality: {quality}\nSleep Duration: {duration} hours")
+    return n, event_count
+
+
+def generate(root, nights=30, sample_interval=60, events_per_hour=20, start_date=date(2025, 1, 1), seed=0):
+    rng = np.random.default_rng(seed)
+    totals = np.zeros(2, dtype=np.int64)
+    for i in range(nights):
+        totals += generate_night(root, start_date + timedelta(days=i), rng, sample_interval, events_per_hour)
+    return {"nights": nights, "sensor_rows": int(totals[0]), "event_rows": int(totals[1])}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic sleep_data tree.")
+    parser.add_argument("root")
+    parser.add_argument("--nights", type=int, default=30)
+    parser.add_argument("--sample-interval", type=int, default=60, help="seconds between sensor readings")
+    parser.add_argument("--events-per-hour", type=float, default=20)
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2025, 1, 1))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    summary = generate(args.root, args.nights, args.sample_interval, args.events_per_hour, args.start_date, args.seed)
+    print(f"Wrote {summary['nights']} nights ({summary['sensor_rows']} sensor rows, "
+          f"{summary['event_rows']} events) to {args.root}")
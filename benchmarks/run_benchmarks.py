@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.generate_dataset import generate
+from binary_ingest import SENSOR_RECORD, STRUCT_TYPE
+
+# Benchmarks for ingest throughput, read endpoint latency and analysis runtime on
+# a synthetic dataset. Results are written as JSON (default
+# benchmarks/results/<commit>.json) so runs can be compared across commits:
+#   python -m benchmarks.run_benchmarks --nights 60 --sample-interval 10
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+SENSOR_READING = {"temperature": 68.5, "humidity": 55.0, "heat_index": 68.2, "light": 3, "sound": 1250}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def latency_summary(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "count": int(len(samples)),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(samples.mean()),
+        "max_ms": float(samples.max()),
+    }
+
+
+async def post_all(client, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def send(path, body):
+        async with semaphore:
+            start = time.perf_counter()
+            if isinstance(body, bytes):
+                response = await client.post(path, content=body, headers={"content-type": STRUCT_TYPE})
+            else:
+                response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(path, body) for path, body in requests))
+    return time.perf_counter() - start, latencies
+
+
+async def bench_ingest(data_root, readings, batch_size, concurrency):
+    import httpx
+    # Request logging is part of what's measured only when asked for
+    os.environ.setdefault("SLEEP_LOG_LEVEL", "OFF")
+    import main
+
+    main.parent_data_dir = data_root
+    main.night = "ingest-bench"
+    results = {}
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            single = [("/sensorData", SENSOR_READING)] * readings
+            elapsed, latencies = await post_all(client, single, concurrency)
+            results["single"] = {"requests_per_s": readings / elapsed, "readings_per_s": readings / elapsed,
+                                 **latency_summary(latencies)}
+
+            batches = [("/sensorData/batch", [SENSOR_READING] * batch_size)] * max(1, readings // batch_size)
+            elapsed, latencies = await post_all(client, batches, concurrency)
+            results["batch"] = {"batch_size": batch_size, "requests_per_s": len(batches) / elapsed,
+                                "readings_per_s": len(batches) * batch_size / elapsed,
+                                **latency_summary(latencies)}
+
+            # Same batches as packed struct records instead of JSON
+            record = np.zeros(batch_size, dtype=SENSOR_RECORD)
+            for column, value in SENSOR_READING.items():
+                record[column] = value
+            batches = [("/sensorData/batch", record.tobytes())] * max(1, readings // batch_size)
+            elapsed, latencies = await post_all(client, batches, concurrency)
+            results["batch_struct"] = {"batch_size": batch_size, "requests_per_s": len(batches) / elapsed,
+                                       "readings_per_s": len(batches) * batch_size / elapsed,
+                                       **latency_summary(latencies)}
+    return results
+
+
+async def bench_reads(data_root, repeats):
+    import httpx
+
+    os.environ["SLEEP_DATA_DIR"] = data_root
+    web_charting = importlib.import_module("web_charting")
+    web_charting = importlib.reload(web_charting)
+
+    transport = httpx.ASGITransport(app=web_charting.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def timed_get(path):
+            start = time.perf_counter()
+            response = await client.get(path)
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            return elapsed, len(response.content)
+
+        nights_latency = [(await timed_get("/availableNights"))[0] for _ in range(repeats)]
+        nights = (await client.get("/availableNights")).json()
+
+        # First read of each night parses the file, later reads may be served from the cache
+        cold = [(await timed_get(f"/sensorData?night={night}"))[0] for night in nights]
+        warm, sizes = [], []
+        for _ in range(repeats):
+            for night in nights:
+                elapsed, size = await timed_get(f"/sensorData?night={night}")
+                warm.append(elapsed)
+                sizes.append(size)
+
+    return {
+        "availableNights": latency_summary(nights_latency),
+        "sensorData_cold": latency_summary(cold),
+        "sensorData_warm": {**latency_summary(warm), "mean_bytes": float(np.mean(sizes))},
+    }
+
+
+def bench_analyses(data_root):
+    # Each analysis runs in a fresh interpreter with empty caches, from a scratch
+    # working directory so generated figures and caches stay out of the repo
+    sys.path.insert(0, REPO_ROOT)
+    from sleep_analysis import ANALYSES
+
+    results = {}
+    for name in ANALYSES:
+        with tempfile.TemporaryDirectory() as scratch:
+            work_dir = os.path.join(scratch, "work")
+            os.makedirs(os.path.join(work_dir, "images"))
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, os.path.join(REPO_ROOT, "sleep_analysis.py"), "run", name,
+                                        "--data", data_root], cwd=work_dir, capture_output=True, text=True)
+            results[name] = {"seconds": time.perf_counter() - start, "returncode": completed.returncode}
+            if completed.returncode != 0:
+                results[name]["error"] = completed.stderr.strip().splitlines()[-1:]
+    return results
+
+
+def parse_importtime(stderr):
+    # -X importtime lines: "import time: self [us] | cumulative | package" (nested imports are indented)
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((name.rstrip(), int(cumulative)))
+    top_level = [(name, micros) for name, micros in imports if not name.startswith("  ")]
+    return {
+        "import_ms": sum(micros for _, micros in top_level) / 1000,
+        "modules": len(imports),
+        "slowest": [{"module": name.strip(), "ms": micros / 1000}
+                    for name, micros in sorted(top_level, key=lambda item: -item[1])[:5]],
+    }
+
+
+def bench_startup(data_root):
+    # Wall time and -X importtime totals for quick sleep_analysis commands and for
+    # importing each analysis script (which should not pull in matplotlib or scipy)
+    from sleep_analysis import ANALYSES
+
+    runs = {f"sleep_analysis {command}": [os.path.join(REPO_ROOT, "sleep_analysis.py"), *command.split(), "--data", data_root]
+            for command in ("latency", "keywords")}
+    runs.update({f"import {name}": ["-c", f"import sys; sys.path.insert(0, {os.path.join(REPO_ROOT, 'data_analysis_scripts')!r}); "
+                                          f"import {name}"] for name in ANALYSES})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for label, command in runs.items():
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-X", "importtime", *command], cwd=work_dir,
+                                       capture_output=True, text=True)
+            results[label] = {"seconds": time.perf_counter() - start, "returncode": completed.returncode,
+                              **parse_importtime(completed.stderr)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the sleep sensor benchmark suite.")
+    parser.add_argument("--nights", type=int, default=30)
+    parser.add_argument("--sample-interval", type=int, default=60, help="seconds between sensor readings")
+    parser.add_argument("--events-per-hour", type=float, default=20)
+    parser.add_argument("--ingest-readings", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=5, help="passes over every night for read latency")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["ingest", "reads", "analyses", "startup"])
+    parser.add_argument("--output", default=None, help="defaults to benchmarks/results/<commit>.json")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_ROOT)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": vars(args),
+    }
+
+    with tempfile.TemporaryDirectory() as scratch:
+        data_root = os.path.join(scratch, "sleep_data")
+        start = time.perf_counter()
+        report["dataset"] = generate(data_root, args.nights, args.sample_interval, args.events_per_hour)
+        report["dataset"]["generate_seconds"] = time.perf_counter() - start
+
+        if "ingest" not in args.skip:
+            ingest_root = os.path.join(scratch, "ingest")
+            report["ingest"] = asyncio.run(bench_ingest(ingest_root, args.ingest_readings, args.batch_size,
+                                                        args.concurrency))
+        if "reads" not in args.skip:
+            report["reads"] = asyncio.run(bench_reads(data_root, args.repeats))
+        if "analyses" not in args.skip:
+            report["analyses"] = bench_analyses(data_root)
+        if "startup" not in args.skip:
+            report["startup"] = bench_startup(data_root)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
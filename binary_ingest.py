@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import numpy as np
+
+from night_archive import EVENT_CODES
+
+# Compact alternatives to the JSON ingest bodies, picked by Content-Type:
+#
+#   application/x-sleep-sensor   packed little-endian records, no header
+#       sensor reading  <q f f f i i>  epoch seconds, temperature, humidity, heat index, light, sound  (28 bytes)
+#       sleep event     <q B>          epoch seconds, event code (0 LIGHT, 1 SOUND, 2 MOVEMENT)          (9 bytes)
+#     An epoch of 0 means "now". The device id goes in the device_id query parameter.
+#   application/msgpack   the same maps as the JSON bodies (needs the msgpack package)
+#
+# Struct bodies are read in place with numpy.frombuffer and turned into storage
+# rows column by column, without building a pydantic model per reading.
+
+STRUCT_TYPE = "application/x-sleep-sensor"
+MSGPACK_TYPE = "application/msgpack"
+
+SENSOR_RECORD = np.dtype([("timestamp", "<i8"), ("temperature", "<f4"), ("humidity", "<f4"), ("heat_index", "<f4"),
+                          ("light", "<i4"), ("sound", "<i4")])
+EVENT_RECORD = np.dtype([("timestamp", "<i8"), ("sleep_event", "u1")])
+EVENT_NAMES = list(EVENT_CODES)
+# Epochs up to the end of year 9999, less a day so any local offset still formats
+MAX_EPOCH = 253402300800 - 86400
+
+
+def body_format(content_type):
+    # "struct", "msgpack" or None for JSON
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type == STRUCT_TYPE:
+        return "struct"
+    if content_type in (MSGPACK_TYPE, "application/x-msgpack"):
+        return "msgpack"
+    return None
+
+
+def unpack_msgpack(body):
+    # ImportError if msgpack isn't installed, ValueError for a bad body
+    import msgpack
+    try:
+        return msgpack.unpackb(body, raw=False)
+    except Exception as e:
+        raise ValueError(f"Invalid msgpack body: {e}")
+
+
+def read_records(body, record):
+    if len(body) % record.itemsize:
+        raise ValueError(f"Body is {len(body)} bytes, not a whole number of {record.itemsize} byte records")
+    return np.frombuffer(body, dtype=record)
+
+
+def format_epochs(epochs):
+    # Epoch seconds as local "YYYY-MM-DD HH:MM:SS" like format_timestamp in main.py; 0 is now
+    epochs = np.where(epochs == 0, int(datetime.now().timestamp()), epochs)
+    if not len(epochs):
+        return []
+    bad = (epochs < 0) | (epochs > MAX_EPOCH)
+    if bad.any():
+        raise ValueError(f"Timestamp out of range: {int(epochs[bad][0])}")
+    first, last = int(epochs.min()), int(epochs.max())
+    offset = datetime.fromtimestamp(first).astimezone().utcoffset()
+    if offset != datetime.fromtimestamp(last).astimezone().utcoffset():
+        # The batch crosses a DST change, convert one by one
+        return [datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S") for epoch in epochs.tolist()]
+    local = (epochs + int(offset.total_seconds())).astype("datetime64[s]")
+    return [timestamp.replace("T", " ") for timestamp in np.datetime_as_string(local).tolist()]
+
+
+def reading_values(values):
+    # float32 readings as the shortest decimal that round trips ("66.09", not 66.0899963...)
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return distinct.astype(str).astype(np.float64)[inverse].tolist()
+
+
+def sensor_rows(body):
+    records = read_records(body, SENSOR_RECORD)
+    columns = [format_epochs(records["timestamp"])]
+    columns += [reading_values(records[name]) for name in ("temperature", "humidity", "heat_index")]
+    columns += [records[name].tolist() for name in ("light", "sound")]
+    return [list(row) for row in zip(*columns)]
+
+
+def sleep_event_rows(body):
+    records = read_records(body, EVENT_RECORD)
+    codes = records["sleep_event"]
+    if len(codes) and codes.max() >= len(EVENT_NAMES):
+        raise ValueError(f"Unknown sleep event code {int(codes.max())}")
+    names = [EVENT_NAMES[code] for code in codes.tolist()]
+    return [list(row) for row in zip(format_epochs(records["timestamp"]), names)]
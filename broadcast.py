@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+
+class Subscriber:
+    def __init__(self, max_buffer):
+        self.queue = asyncio.Queue(maxsize=max_buffer)
+        self.dropped = False
+
+
+class Broadcaster:
+    # Fan-out of ingested rows to live subscribers. Each subscriber has a bounded
+    # buffer; publish never waits, and a subscriber whose buffer is full is dropped
+    # (its stream closes and the client reconnects) instead of slowing down ingest.
+
+    def __init__(self, max_buffer=256):
+        self.max_buffer = max_buffer
+        self.subscribers = set()
+        self.dropped = 0
+
+    def subscribe(self):
+        subscriber = Subscriber(self.max_buffer)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, kind, payload):
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait((kind, payload))
+            except asyncio.QueueFull:
+                self.drop(subscriber)
+                self.dropped += 1
+
+    def drop(self, subscriber):
+        # Clear the buffer so the end-of-stream marker always fits
+        self.unsubscribe(subscriber)
+        subscriber.dropped = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def close(self):
+        for subscriber in list(self.subscribers):
+            self.drop(subscriber)
+
+    async def stream(self, subscriber, keepalive=15.0):
+        # Server-Sent Events body for one subscriber
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None:
+                    return
+                kind, payload = item
+                yield f"event: {kind}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,197 @@
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+from night_archive import to_epoch
+from storage import TABLES
+
+# Cross-night correlations of what the sensors saw with the journal's sleep onset
+# latency and quality, computed for every night at once. Rows of all nights are
+# sorted by a composite (night, time) key, so each night's window bounds for every
+# window are one np.searchsorted call and window means come from prefix sums
+# (the same approach as data_analysis_scripts/event_matching.py).
+#
+# Windows: "onset" is bed time to bed time + latency (the sensor_corr script),
+# "night" is bed to wake time (the event count script), "<N>m" is the first N
+# minutes after bed time. Bed and wake times are the night's ground truth marks.
+
+NIGHT_SHIFT = np.int64(2 ** 40)  # seconds per night slot
+SENSOR_COLUMNS = TABLES["sensor_data"][1][1:]
+EVENT_TYPES = ["LIGHT", "SOUND", "MOVEMENT"]
+TARGETS = ["latency", "quality"]
+DEFAULT_WINDOWS = ["onset", "night"]
+WINDOW_PATTERN = re.compile(r"onset|night|[1-9]\d*m")
+
+
+def parse_windows(value):
+    windows = [window.strip() for window in value.split(",") if window.strip()] if value else DEFAULT_WINDOWS
+    for window in windows:
+        if not WINDOW_PATTERN.fullmatch(window):
+            raise ValueError(f"Unknown window: {window} (use onset, night or <minutes>m)")
+    return list(dict.fromkeys(windows))
+
+
+def parse_timestamp(text):
+    # Hand-edited marks can have unpadded hours or fractional seconds
+    for layout in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f"):
+        try:
+            return int(datetime.strptime(text, layout).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            pass
+    raise ValueError(f"Bad timestamp: {text}")
+
+
+def epoch_seconds(timestamps):
+    try:
+        return to_epoch(timestamps)
+    except ValueError:
+        return np.array([parse_timestamp(t) for t in timestamps], dtype=np.int64)
+
+
+class NightData:
+    # Every night's sensor readings and events as sorted key arrays, plus the
+    # per-night bed/wake times and journal fields. Built once per set of nights.
+
+    def __init__(self, storage, journal_index, nights):
+        self.nights = list(nights)
+        count = len(self.nights)
+        self.bed = np.full(count, np.nan)
+        self.wake = np.full(count, np.nan)
+        self.targets = {target: np.full(count, np.nan) for target in TARGETS}
+        self.has_sensors = np.zeros(count, dtype=bool)
+        self.has_events = np.zeros(count, dtype=bool)
+
+        sensor_keys, sensor_values, event_keys, event_codes = [], [], [], []
+        for code, night in enumerate(self.nights):
+            devices = storage.devices(night)
+            summary = journal_index.summary(night)
+            if summary is not None:
+                for target in TARGETS:
+                    if summary[target] is not None:
+                        self.targets[target][code] = summary[target]
+
+            # Bed and wake marks come from one device: the default one unless it has none
+            marks = [storage.read("ground_truth", night, device=device) or [] for device in devices]
+            marks = next((rows for rows in marks if rows), [])
+            times = epoch_seconds([row["timestamp"] for row in marks[:2]])
+            if len(times) >= 1:
+                self.bed[code] = times[0]
+            if len(times) >= 2:
+                self.wake[code] = times[1]
+
+            sensors = storage.read_devices("sensor_data", night, devices) if devices else None
+            if sensors:
+                self.has_sensors[code] = True
+                sensor_keys.append(code * NIGHT_SHIFT + epoch_seconds([row["timestamp"] for row in sensors]))
+                # CSV rows are strings and SQLite rows are typed, so only missing values are NaN (light can be 0)
+                sensor_values.append(np.array([[np.nan if row[column] in (None, "") else float(row[column])
+                                                for column in SENSOR_COLUMNS] for row in sensors], dtype=np.float64))
+            events = storage.read_devices("sleep_events", night, devices) if devices else None
+            if events:
+                self.has_events[code] = True
+                event_keys.append(code * NIGHT_SHIFT + epoch_seconds([row["timestamp"] for row in events]))
+                event_codes.append(np.array([EVENT_TYPES.index(row["sleep_event"]) if row["sleep_event"] in EVENT_TYPES
+                                             else -1 for row in events], dtype=np.int8))
+
+        self.sensor_keys, order = self.sorted_keys(sensor_keys)
+        values = np.concatenate(sensor_values)[order] if sensor_values else np.zeros((0, len(SENSOR_COLUMNS)))
+        present = ~np.isnan(values)
+        self.sensor_values = values
+        self.sensor_sums = np.vstack([np.zeros(len(SENSOR_COLUMNS)), np.cumsum(np.where(present, values, 0.0), axis=0)])
+        self.sensor_counts = np.vstack([np.zeros(len(SENSOR_COLUMNS)), np.cumsum(present, axis=0)])
+
+        self.event_keys, order = self.sorted_keys(event_keys)
+        codes = np.concatenate(event_codes)[order] if event_codes else np.zeros(0, dtype=np.int8)
+        self.event_counts = {event: np.concatenate([[0], np.cumsum(codes == i)]) for i, event in enumerate(EVENT_TYPES)}
+
+    @staticmethod
+    def sorted_keys(parts):
+        keys = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        return keys[order], order
+
+    def window(self, window):
+        # (start, end) epoch seconds per night, NaN where the night lacks what the window needs
+        if window == "onset":
+            return self.bed, self.bed + self.targets["latency"] * 60
+        if window == "night":
+            return self.bed, self.wake
+        return self.bed, self.bed + int(window[:-1]) * 60
+
+    def bounds(self, keys, start, end):
+        valid = ~np.isnan(start) & ~np.isnan(end)
+        codes = np.arange(len(self.nights), dtype=np.int64) * NIGHT_SHIFT
+        lo = np.searchsorted(keys, codes + np.where(valid, start, 0).astype(np.int64), side="left")
+        hi = np.searchsorted(keys, codes + np.floor(np.where(valid, end, 0)).astype(np.int64), side="right")
+        return lo, np.maximum(hi, lo), valid
+
+    def sensor_means(self, start, end):
+        # Mean of each column over [start, end]; nearest reading to the end if the window is empty
+        lo, hi, valid = self.bounds(self.sensor_keys, start, end)
+        counts = self.sensor_counts[hi] - self.sensor_counts[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (self.sensor_sums[hi] - self.sensor_sums[lo]) / counts
+        means = np.where(counts > 0, means, np.nan)
+
+        empty = valid & self.has_sensors & (counts == 0).all(axis=1)
+        if empty.any() and len(self.sensor_keys):
+            targets = np.flatnonzero(empty) * NIGHT_SHIFT + np.floor(end[empty]).astype(np.int64)
+            after = np.clip(np.searchsorted(self.sensor_keys, targets), 0, len(self.sensor_keys) - 1)
+            before = np.clip(after - 1, 0, len(self.sensor_keys) - 1)
+            codes = np.flatnonzero(empty)
+            before_ok = self.sensor_keys[before] // NIGHT_SHIFT == codes
+            after_ok = self.sensor_keys[after] // NIGHT_SHIFT == codes
+            after_closer = after_ok & (~before_ok | (self.sensor_keys[after] - targets < targets - self.sensor_keys[before]))
+            nearest = np.where(after_closer, after, before)
+            means[empty] = self.sensor_values[nearest]
+        means[~valid | ~self.has_sensors] = np.nan
+        return means
+
+    def event_counts_between(self, start, end):
+        lo, hi, valid = self.bounds(self.event_keys, start, end)
+        counts = {event: (cumulative[hi] - cumulative[lo]).astype(np.float64) for event, cumulative in self.event_counts.items()}
+        counts["events"] = sum(counts.values())
+        keep = valid & self.has_events
+        return {event: np.where(keep, values, np.nan) for event, values in counts.items()}
+
+    def features(self, windows):
+        # feature name -> value per night
+        features = {}
+        for window in windows:
+            start, end = self.window(window)
+            means = self.sensor_means(start, end)
+            for i, column in enumerate(SENSOR_COLUMNS):
+                features[f"{window}_{column}"] = means[:, i]
+            for event, counts in self.event_counts_between(start, end).items():
+                features[f"{window}_{event.lower()}_count"] = counts
+        return features
+
+
+def pearson(x, y):
+    # r and (if scipy is installed) the two-sided p-value, like scipy.stats.pearsonr
+    x = x - x.mean()
+    y = y - y.mean()
+    denominator = np.sqrt((x * x).sum() * (y * y).sum())
+    if denominator == 0:
+        return None, None
+    r = float(np.clip((x * y).sum() / denominator, -1.0, 1.0))
+    try:
+        from scipy.stats import beta
+    except ImportError:
+        return r, None
+    half = len(x) / 2 - 1
+    return r, float(2 * beta.sf(abs(r) / 2 + 0.5, half, half)) if half > 0 else None
+
+
+def correlate(data, windows, exclude=()):
+    excluded = np.isin(data.nights, list(exclude))
+    results = []
+    for feature, values in data.features(windows).items():
+        for target in TARGETS:
+            targets = data.targets[target]
+            keep = ~excluded & ~np.isnan(values) & ~np.isnan(targets)
+            r, p = pearson(values[keep], targets[keep]) if keep.sum() >= 3 else (None, None)
+            results.append({"feature": feature, "target": target, "n": int(keep.sum()), "r": r, "p": p,
+                            "nights": [night for night, kept in zip(data.nights, keep) if kept]})
+    return results
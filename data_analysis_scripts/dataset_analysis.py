@@ -1,47 +1,24 @@
-import os
-import re
-import matplotlib.pyplot as plt
-from datetime import datetime
 from collections import Counter
 
+from night_results import load_night_results
+from render_pipeline import Figure, render
+
 
 def extract_sleep_data_and_keyword_counts(top_dir):
-    latency_by_date = {}
-    quality_by_date = {}
-    keyword_counts = {
-        "melatonin": Counter(),
-        "unisom": Counter()
-    }
+    nights = load_night_results(top_dir)
+    journals = nights[nights["has_journal"]]
+
+    latency = journals.dropna(subset=["latency"])
+    latency_by_date = dict(zip(latency["date"], latency["latency"]))
+
+    quality = journals.dropna(subset=["quality"])
+    quality_by_date = dict(zip(quality["date"], quality["quality"]))
 
-    for entry in os.listdir(top_dir):
-        dir_path = os.path.join(top_dir, entry)
-        if os.path.isdir(dir_path) and re.match(r"\d{4}-\d{2}-\d{2}", entry):
-            journal_path = os.path.join(dir_path, "journal.txt")
-            if os.path.exists(journal_path):
-                try:
-                    with open(journal_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    content_lower = content.lower()
-                    date = datetime.strptime(entry, "%Y-%m-%d")
-
-                    # Extract latency and quality
-                    latency_match = re.search(r"Sleep Onset Latency:\s*([\d.]+)", content)
-                    if latency_match:
-                        latency_by_date[date] = float(latency_match.group(1))
-
-                    quality_match = re.search(r"Sleep Quality:\s*([\d.]+)", content)
-                    if quality_match:
-                        quality_by_date[date] = float(quality_match.group(1))
-
-                    # Count keyword mentions
-                    for keyword in keyword_counts:
-                        if keyword in content_lower:
-                            keyword_counts[keyword]["mentioned"] += 1
-                        else:
-                            keyword_counts[keyword]["not_mentioned"] += 1
-
-                except Exception as e:
-                    print(f"Error reading {journal_path}: {e}")
+    # Count keyword mentions
+    keyword_counts = {}
+    for keyword in ["melatonin", "unisom"]:
+        mentioned = int(journals[keyword].sum())
+        keyword_counts[keyword] = Counter(mentioned=mentioned, not_mentioned=len(journals) - mentioned)
 
     return (
         dict(sorted(latency_by_date.items())),
@@ -51,13 +28,8 @@ def extract_sleep_data_and_keyword_counts(top_dir):
 
 
 
-def plot_time_series(data, title, ylabel, output_path):
-    if not data:
-        print(f"No {ylabel} data to plot.")
-        return
-
-    dates = list(data.keys())
-    values = list(data.values())
+def draw_time_series(dates, values, title, ylabel):
+    import matplotlib.pyplot as plt
 
     plt.figure(figsize=(10, 5))
     plt.plot(dates, values, marker='o', linestyle='-', color='teal')
@@ -68,10 +40,12 @@ def plot_time_series(data, title, ylabel, output_path):
     plt.tight_layout()
     plt.xticks(rotation=45)
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    plt.savefig(output_path)
-    plt.close()
-    print(f"Saved: {output_path}")
+
+def time_series_figure(data, title, ylabel, output_path):
+    if not data:
+        print(f"No {ylabel} data to plot.")
+        return []
+    return [Figure(output_path, draw_time_series, list(data.keys()), list(data.values()), title, ylabel)]
 
 def categorize_latency(latency_data):
     categories = {
@@ -91,7 +65,9 @@ def categorize_latency(latency_data):
     return categories
 
 
-def plot_latency_categories(categories, output_path):
+def draw_latency_categories(categories):
+    import matplotlib.pyplot as plt
+
     labels = list(categories.keys())
     values = list(categories.values())
     colors = ['green', 'gold', 'red']  # green for Normal, yellow for Mild, red for Severe
@@ -102,14 +78,10 @@ def plot_latency_categories(categories, output_path):
     plt.ylabel("Number of Nights")
     plt.tight_layout()
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    plt.savefig(output_path)
-    plt.close()
-    print(f"Saved: {output_path}")
 
+def draw_keyword_counts(keyword, counts):
+    import matplotlib.pyplot as plt
 
-
-def plot_keyword_counts(keyword, counts, output_path):
     labels = ['Consumed', 'Not Consumed']
     values = [counts['mentioned'], counts['not_mentioned']]
 
@@ -119,26 +91,27 @@ def plot_keyword_counts(keyword, counts, output_path):
     plt.ylabel("Number of Nights")
     plt.tight_layout()
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    plt.savefig(output_path)
-    plt.close()
-    print(f"Saved: {output_path}")
 
+def main(top_dir="sleep_data", jobs=1):
+    latency_data, quality_data, keyword_counts = extract_sleep_data_and_keyword_counts(top_dir)
+
+    figures = time_series_figure(latency_data, "Sleep Onset Latency Over Time", "Sleep Onset Latency (minutes)",
+                                 "../images/sleep_latency.png")
+
+    figures += time_series_figure(quality_data, "Sleep Quality Over Time", "Sleep Quality (1–5 scale)",
+                                  "../images/sleep_quality.png")
 
-# Example usage
-top_directory = "sleep_data"
-latency_data, quality_data, keyword_counts = extract_sleep_data_and_keyword_counts(top_directory)
+    # Categorize and plot sleep onset latency
+    latency_categories = categorize_latency(latency_data)
+    figures.append(Figure("../images/latency_categories.png", draw_latency_categories, latency_categories))
 
-plot_time_series(latency_data, "Sleep Onset Latency Over Time", "Sleep Onset Latency (minutes)",
-                 "../images/sleep_latency.png")
+    # Plot keyword mentions
+    for keyword, counts in keyword_counts.items():
+        output_file = f"images/{keyword}_mentions.png"
+        figures.append(Figure(output_file, draw_keyword_counts, keyword, dict(counts)))
 
-plot_time_series(quality_data, "Sleep Quality Over Time", "Sleep Quality (1–5 scale)", "../images/sleep_quality.png")
+    render(figures, jobs)
 
-# Categorize and plot sleep onset latency
-latency_categories = categorize_latency(latency_data)
-plot_latency_categories(latency_categories, "../images/latency_categories.png")
 
-# Plot keyword mentions
-for keyword, counts in keyword_counts.items():
-    output_file = f"images/{keyword}_mentions.png"
-    plot_keyword_counts(keyword, counts, output_file)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import os
+import pickle
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# The scripts are run from data_analysis_scripts/, the shared modules live in the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from journal_index import parse_fields  # noqa: E402
+from night_archive import EVENT_NAMES, archive_path, read_archive_arrays  # noqa: E402
+
+# Shared loader for the analysis scripts. Every night under sleep_data is parsed
+# once into typed, night-tagged DataFrames and the result is pickled to a
+# snapshot; later loads only re-parse nights whose source files changed.
+
+SNAPSHOT_VERSION = 2
+DEFAULT_SNAPSHOT = os.path.join(".cache", "dataset_snapshot.pkl")
+
+NIGHT_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+SOURCE_FILES = ["sensor_data_log.csv", "sleep_event_log.csv", "ground_truth_log.csv", "journal.txt"]
+LOG_FILES = SOURCE_FILES[:3]
+# Finished nights may be compacted by night_archive.py into <log>.arc files
+ARCHIVE_FILES = [os.path.splitext(name)[0] + ".arc" for name in LOG_FILES]
+# Logs without a device_id are in the night directory, other devices under devices/<id>/
+DEFAULT_DEVICE = "default"
+SENSOR_COLUMNS = ["temperature", "humidity", "heat_index", "light", "sound"]
+EVENT_TYPES = ["LIGHT", "SOUND", "MOVEMENT"]
+KEYWORDS = ["melatonin", "unisom"]
+
+
+def list_nights(top_dir):
+    return sorted(entry for entry in os.listdir(top_dir)
+                  if os.path.isdir(os.path.join(top_dir, entry)) and NIGHT_PATTERN.match(entry))
+
+
+def list_devices(dir_path):
+    devices = [DEFAULT_DEVICE]
+    devices_dir = os.path.join(dir_path, "devices")
+    if os.path.isdir(devices_dir):
+        devices.extend(sorted(name for name in os.listdir(devices_dir) if os.path.isdir(os.path.join(devices_dir, name))))
+    return devices
+
+
+def device_dir(dir_path, device):
+    return dir_path if device == DEFAULT_DEVICE else os.path.join(dir_path, "devices", device)
+
+
+def source_names(dir_path):
+    # Every source file of a night relative to its directory: the default device's
+    # logs and the journal, then any other devices' logs
+    names = list(SOURCE_FILES)
+    names.extend(name for name in ARCHIVE_FILES if os.path.exists(os.path.join(dir_path, name)))
+    for device in list_devices(dir_path)[1:]:
+        names.extend(f"devices/{device}/{name}" for name in LOG_FILES + ARCHIVE_FILES
+                     if os.path.exists(os.path.join(device_dir(dir_path, device), name)))
+    return names
+
+
+def night_signature(dir_path):
+    signature = []
+    for name in source_names(dir_path):
+        path = os.path.join(dir_path, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def parse_journal(content):
+    fields = {field: float("nan") if value is None else value for field, value in parse_fields(content).items()}
+    content_lower = content.lower()
+    for keyword in KEYWORDS:
+        fields[keyword] = keyword in content_lower
+    return fields
+
+
+def read_archive_frame(path):
+    epoch, arrays = read_archive_arrays(path)
+    frame = pd.DataFrame({"timestamp": epoch.astype("datetime64[s]").astype("datetime64[ns]")})
+    for column, values in arrays.items():
+        if values.dtype == np.float32:
+            # Through the shortest repr, so values equal what parsing the CSV gave
+            frame[column] = values.astype(str).astype("float64")
+        elif values.dtype == np.uint8:
+            frame[column] = EVENT_NAMES[values]
+        else:
+            frame[column] = values.astype("int64")
+    return frame
+
+
+def log_exists(path):
+    return os.path.exists(path) or os.path.exists(archive_path(path))
+
+
+def read_log(path, columns):
+    # Archived rows first, then the CSV. Missing and zero-byte logs both come back
+    # as an empty frame with the right columns.
+    frames = []
+    if os.path.exists(archive_path(path)):
+        frames.append(read_archive_frame(archive_path(path)))
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        frame = pd.read_csv(path, parse_dates=["timestamp"])
+        frame["timestamp"] = frame["timestamp"].astype("datetime64[ns]")
+        frames.append(frame)
+    if len(frames) == 1:
+        return frames[0]
+    if frames:
+        return pd.concat(frames, ignore_index=True)
+    return pd.DataFrame({column: pd.Series(dtype="datetime64[ns]" if column == "timestamp" else "float64")
+                         for column in columns})
+
+
+def read_device_logs(dir_path, device):
+    paths = {name: os.path.join(device_dir(dir_path, device), name) for name in LOG_FILES}
+    sensors = read_log(paths["sensor_data_log.csv"], ["timestamp", *SENSOR_COLUMNS])
+    sensors[SENSOR_COLUMNS] = sensors[SENSOR_COLUMNS].astype("float64")
+    events = read_log(paths["sleep_event_log.csv"], ["timestamp", "sleep_event"])
+    ground_truth = read_log(paths["ground_truth_log.csv"], ["timestamp"])
+    logs = {"sensors": sensors, "events": events, "ground_truth": ground_truth}
+    for frame in logs.values():
+        frame.insert(0, "device", device)
+    return logs, {name: log_exists(path) for name, path in paths.items()}
+
+
+def load_night(top_dir, night):
+    dir_path = os.path.join(top_dir, night)
+    journal_path = os.path.join(dir_path, "journal.txt")
+
+    per_device = {device: read_device_logs(dir_path, device) for device in list_devices(dir_path)}
+    exists = {name: any(found[name] for _, found in per_device.values()) for name in LOG_FILES}
+
+    def merge(name):
+        # Several devices are merged by timestamp (stable, so each device keeps its order)
+        frames = [logs[name] for logs, _ in per_device.values()]
+        if len(frames) == 1:
+            return frames[0]
+        frame = pd.concat(frames, ignore_index=True)
+        return frame.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+    sensors, events, ground_truth = merge("sensors"), merge("events"), merge("ground_truth")
+    # Bed and wake marks come from one device: the default one unless it has none
+    marks = next((logs["ground_truth"] for logs, _ in per_device.values() if len(logs["ground_truth"])),
+                 per_device[DEFAULT_DEVICE][0]["ground_truth"])
+
+    record = {
+        "night": night,
+        "date": pd.Timestamp(night),
+        "has_sensor_data": exists["sensor_data_log.csv"],
+        "has_sleep_events": exists["sleep_event_log.csv"],
+        "has_ground_truth": exists["ground_truth_log.csv"],
+        "has_journal": os.path.exists(journal_path),
+        "ground_truth_count": len(marks),
+        "bed_time": marks["timestamp"].iloc[0] if len(marks) >= 1 else pd.NaT,
+        "wake_time": marks["timestamp"].iloc[1] if len(marks) >= 2 else pd.NaT,
+        "journal": "",
+    }
+    if record["has_journal"]:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            record["journal"] = f.read()
+    record.update(parse_journal(record["journal"]))
+
+    for frame in (sensors, events, ground_truth):
+        frame.insert(0, "night", night)
+    return {"sensors": sensors, "events": events, "ground_truth": ground_truth, "night": record}
+
+
+def try_load_night(top_dir, night):
+    try:
+        return load_night(top_dir, night), None
+    except Exception as e:
+        return None, str(e)
+
+
+def load_nights(top_dir, nights, jobs=1):
+    # Parse nights in a process pool when there is more than one to do
+    if jobs > 1 and len(nights) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(nights))) as pool:
+            results = list(pool.map(try_load_night, [top_dir] * len(nights), nights))
+    else:
+        results = [try_load_night(top_dir, night) for night in nights]
+    return dict(zip(nights, results))
+
+
+class Dataset:
+    # nights: one row per night (ground truth bounds, parsed journal fields, flags)
+    # sensors / events / ground_truth: all nights concatenated, tagged with "night"
+    # and "device", every device of a night merged by timestamp
+
+    def __init__(self, nights, sensors, events, ground_truth):
+        self.nights = nights
+        self.sensors = sensors
+        self.events = events
+        self.ground_truth = ground_truth
+        self._positions = {}
+
+    def for_night(self, frame_name, night):
+        if frame_name not in self._positions:
+            self._positions[frame_name] = getattr(self, frame_name).groupby("night", observed=True).indices
+        frame = getattr(self, frame_name)
+        positions = self._positions[frame_name].get(night)
+        if positions is None:
+            return frame.iloc[0:0]
+        return frame.iloc[positions]
+
+    def devices(self):
+        return list(self.sensors["device"].cat.categories)
+
+    def select_devices(self, devices):
+        # The same dataset restricted to some devices (the nights table is shared)
+        def keep(frame):
+            return frame[frame["device"].isin(devices)].reset_index(drop=True)
+        return Dataset(self.nights, keep(self.sensors), keep(self.events), keep(self.ground_truth))
+
+
+def build_dataset(parts):
+    nights = sorted(parts)
+    night_type = pd.CategoricalDtype(nights, ordered=True)
+
+    devices = sorted({device for night in nights for name in ("sensors", "events", "ground_truth")
+                      for device in parts[night][name]["device"].unique()} | {DEFAULT_DEVICE},
+                     key=lambda device: (device != DEFAULT_DEVICE, device))
+    device_type = pd.CategoricalDtype(devices)
+
+    def combine(name):
+        frame = pd.concat([parts[night][name] for night in nights], ignore_index=True)
+        frame["night"] = frame["night"].astype(night_type)
+        frame["device"] = frame["device"].astype(device_type)
+        return frame
+
+    events = combine("events")
+    events["sleep_event"] = events["sleep_event"].astype(pd.CategoricalDtype(EVENT_TYPES))
+    night_table = pd.DataFrame([parts[night]["night"] for night in nights]).set_index("night", drop=False)
+    return Dataset(night_table, combine("sensors"), events, combine("ground_truth"))
+
+
+def load_snapshot(snapshot_path):
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable snapshot {snapshot_path}: {e}")
+        return None
+    return snapshot if snapshot.get("version") == SNAPSHOT_VERSION else None
+
+
+def save_snapshot(snapshot_path, snapshot):
+    os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, snapshot_path)
+
+
+# Snapshots already loaded in this process, keyed by snapshot path
+_loaded = {}
+
+
+def load_dataset(top_dir="sleep_data", snapshot_path=DEFAULT_SNAPSHOT, jobs=1):
+    top_dir_abs = os.path.abspath(top_dir)
+    snapshot = _loaded.get(snapshot_path) or load_snapshot(snapshot_path)
+    if snapshot is None or snapshot["top_dir"] != top_dir_abs:
+        snapshot = {"version": SNAPSHOT_VERSION, "top_dir": top_dir_abs, "nights": {}}
+
+    nights = list_nights(top_dir)
+    signatures = {night: night_signature(os.path.join(top_dir, night)) for night in nights}
+    stale = [night for night in nights
+             if night not in snapshot["nights"] or snapshot["nights"][night][0] != signatures[night]]
+
+    for night, (parts, error) in load_nights(top_dir, stale, jobs).items():
+        if parts is None:
+            print(f"Error processing {night}: {error}")
+            snapshot["nights"].pop(night, None)
+        else:
+            snapshot["nights"][night] = (signatures[night], parts)
+
+    removed = set(snapshot["nights"]) - set(nights)
+    for night in removed:
+        del snapshot["nights"][night]
+
+    if stale or removed or "dataset" not in snapshot:
+        snapshot["dataset"] = build_dataset({night: cached[1] for night, cached in snapshot["nights"].items()})
+        save_snapshot(snapshot_path, snapshot)
+    _loaded[snapshot_path] = snapshot
+    return snapshot["dataset"]
@@ -1,60 +1,64 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
-import re
+from datetime import timedelta
 
+from dataset_loader import load_dataset
+from render_pipeline import Figure, render
 
-def plot_sleep_events_for_all_nights(top_dir, output_dir="images/sleep_events"):
-    os.makedirs(output_dir, exist_ok=True)
 
-    for entry in os.listdir(top_dir):
-        dir_path = os.path.join(top_dir, entry)
-        if not os.path.isdir(dir_path) or not re.match(r"\d{4}-\d{2}-\d{2}", entry):
-            continue
+def draw_sleep_events(night, events, start_time, end_time):
+    # events: label -> event times
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(10, 4))
+    for label, times in events.items():
+        plt.scatter(times, [label] * len(times), label=label, s=30)
+
+    plt.title(f"Sleep Events: {night}")
+    plt.xlabel("Time")
+    plt.yticks(sorted(events))
+    plt.xlim(start_time, end_time)
+    plt.grid(True, axis='x', linestyle='--', alpha=0.6)
+    plt.tight_layout()
+    plt.legend()
 
-        ground_truth_path = os.path.join(dir_path, "ground_truth_log.csv")
-        sleep_event_path = os.path.join(dir_path, "sleep_event_log.csv")
 
-        if not os.path.exists(ground_truth_path) or not os.path.exists(sleep_event_path):
+def plot_sleep_events_for_all_nights(top_dir, output_dir="images/sleep_events", jobs=1):
+    dataset = load_dataset(top_dir)
+
+    figures = []
+    for entry, night in dataset.nights.iterrows():
+        if not night["has_ground_truth"] or not night["has_sleep_events"]:
             print(f"Missing files in {entry}, skipping...")
             continue
 
         try:
-            # Load sleep boundaries
-            ground_truth = pd.read_csv(ground_truth_path, parse_dates=['timestamp'])
-            if len(ground_truth) < 2:
+            # Sleep boundaries
+            if night["ground_truth_count"] < 2:
                 print(f"Invalid ground truth data in {entry}")
                 continue
-            bed_time = ground_truth.iloc[0]['timestamp']
-            wake_time = ground_truth.iloc[1]['timestamp']
+            bed_time = night["bed_time"]
+            wake_time = night["wake_time"]
             start_time = bed_time - timedelta(hours=1)
             end_time = wake_time + timedelta(hours=1)
 
-            # Load sleep events
-            events = pd.read_csv(sleep_event_path, parse_dates=['timestamp'])
+            # Sleep events
+            events = dataset.for_night("events", entry)
             filtered_events = events[(events['timestamp'] >= start_time) & (events['timestamp'] <= end_time)]
+            labels = filtered_events['sleep_event'].astype(str)
+            times_by_label = {label: filtered_events['timestamp'][labels == label].to_numpy() for label in labels.unique()}
 
-            # Plot
-            plt.figure(figsize=(10, 4))
-            for label in filtered_events['sleep_event'].unique():
-                times = filtered_events[filtered_events['sleep_event'] == label]['timestamp']
-                plt.scatter(times, [label] * len(times), label=label, s=30)
-
-            plt.title(f"Sleep Events: {entry}")
-            plt.xlabel("Time")
-            plt.yticks(sorted(filtered_events['sleep_event'].unique()))
-            plt.xlim(start_time, end_time)
-            plt.grid(True, axis='x', linestyle='--', alpha=0.6)
-            plt.tight_layout()
-            plt.legend()
-
-            output_path = os.path.join(output_dir, f"{entry}_events.png")
-            plt.savefig(output_path)
-            plt.close()
-            print(f"Saved: {output_path}")
+            figures.append(Figure(os.path.join(output_dir, f"{entry}_events.png"),
+                                  draw_sleep_events, entry, times_by_label, start_time, end_time))
 
         except Exception as e:
             print(f"Error processing {entry}: {e}")
-top_directory = "sleep_data"
-plot_sleep_events_for_all_nights(top_directory)
\ No newline at end of file
+
+    render(figures, jobs)
+
+
+def main(top_dir="sleep_data", jobs=1):
+    plot_sleep_events_for_all_nights(top_dir, jobs=jobs)
+
+
+if __name__ == "__main__":
+    main()
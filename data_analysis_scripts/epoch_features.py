@@ -0,0 +1,160 @@
+import numpy as np
+
+from dataset_loader import EVENT_TYPES, SENSOR_COLUMNS
+
+# Every night binned into fixed epochs (30 s by default) with one float32 feature
+# row per epoch, all nights stacked into a single C-contiguous matrix:
+#
+#   <type>_count              sleep events of each type in the epoch
+#   seconds_since_event       from the night's last event (any type) to the end of the epoch
+#   <sensor>_mean             mean reading in the epoch
+#   <sensor>_rolling_mean     mean reading over the trailing window (window epochs, this one included)
+#   <sensor>_rolling_slope    least squares slope over the same window, per minute
+#
+# Missing values are NaN. A night's epochs run from its first to its last sensor
+# reading or event. Labels come from the ground truth marks and journal latency:
+# 1 asleep (bed time + latency to wake time), 0 awake, NaN if the night lacks any of them.
+#
+# Rows are located with integer epoch arithmetic and aggregated with np.bincount,
+# and the trailing windows are prefix-sum differences clipped at each night's first
+# epoch, so there is no per-night or per-epoch Python loop.
+
+DEFAULT_EPOCH_SECONDS = 30
+DEFAULT_WINDOW_EPOCHS = 10
+MAX_NIGHT_HOURS = 36  # a night's epochs stop here, so a stray timestamp can't blow up the matrix
+NIGHT_SHIFT = np.int64(2 ** 43)  # milliseconds per night slot, as in event_matching.py
+
+
+def feature_columns():
+    columns = [f"{event.lower()}_count" for event in EVENT_TYPES] + ["seconds_since_event"]
+    for column in SENSOR_COLUMNS:
+        columns += [f"{column}_mean", f"{column}_rolling_mean", f"{column}_rolling_slope"]
+    return columns
+
+
+def to_millis(timestamps):
+    return timestamps.to_numpy(dtype="datetime64[ms]").astype(np.int64)
+
+
+class EpochFeatures:
+    def __init__(self, matrix, labels, night_names, row_nights, starts, epoch_seconds, window_epochs):
+        self.matrix = matrix
+        self.columns = feature_columns()
+        self.labels = labels
+        self.night_names = night_names
+        self.row_nights = row_nights  # index into night_names per row
+        self.starts = starts  # epoch start, milliseconds since 1970 (local time like the logs)
+        self.epoch_seconds = epoch_seconds
+        self.window_epochs = window_epochs
+
+    def for_night(self, night):
+        rows = self.row_nights == self.night_names.index(night)
+        return self.matrix[rows], self.labels[rows]
+
+    def save(self, path):
+        np.savez(path, matrix=self.matrix, columns=np.array(self.columns), labels=self.labels,
+                 night_names=np.array(self.night_names), row_nights=self.row_nights, starts=self.starts,
+                 epoch_seconds=self.epoch_seconds, window_epochs=self.window_epochs)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["matrix"], data["labels"], data["night_names"].tolist(), data["row_nights"], data["starts"],
+                       int(data["epoch_seconds"]), int(data["window_epochs"]))
+
+
+def build_epoch_features(dataset, epoch_seconds=DEFAULT_EPOCH_SECONDS, window_epochs=DEFAULT_WINDOW_EPOCHS):
+    night_names = list(dataset.nights.index)
+    codes = {night: code for code, night in enumerate(night_names)}
+    epoch_ms = np.int64(epoch_seconds * 1000)
+
+    sensors = dataset.sensors[dataset.sensors["timestamp"].notna()]
+    events = dataset.events[dataset.events["timestamp"].notna()]
+    sensor_nights = sensors["night"].astype(str).map(codes).to_numpy(dtype=np.int64)
+    event_nights = events["night"].astype(str).map(codes).to_numpy(dtype=np.int64)
+    sensor_ms = to_millis(sensors["timestamp"])
+    event_ms = to_millis(events["timestamp"])
+
+    # Each night's epoch span, from its first to its last reading or event
+    first = np.full(len(night_names), np.iinfo(np.int64).max)
+    last = np.full(len(night_names), np.iinfo(np.int64).min)
+    for nights, millis in ((sensor_nights, sensor_ms), (event_nights, event_ms)):
+        np.minimum.at(first, nights, millis)
+        np.maximum.at(last, nights, millis)
+    has_data = first <= last
+    first_epoch = np.where(has_data, first // epoch_ms, 0)
+    max_epochs = MAX_NIGHT_HOURS * 3600 // epoch_seconds
+    counts = np.where(has_data, np.minimum(last // epoch_ms - first_epoch + 1, max_epochs), 0)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    total = int(offsets[-1])
+
+    row_nights = np.repeat(np.arange(len(night_names)), counts)
+    night_start = offsets[row_nights]  # row of each row's night's first epoch
+    starts = (first_epoch[row_nights] + np.arange(total) - night_start) * epoch_ms
+
+    def rows_of(nights, millis):
+        # Row of each timestamp, -1 past the night's last epoch
+        position = millis // epoch_ms - first_epoch[nights]
+        return np.where(position < counts[nights], offsets[nights] + position, -1)
+
+    matrix = np.full((total, len(feature_columns())), np.nan, dtype=np.float32)
+    column = 0
+
+    # Event counts per type
+    event_rows = rows_of(event_nights, event_ms)
+    event_codes = events["sleep_event"].cat.codes.to_numpy()
+    for code in range(len(EVENT_TYPES)):
+        keep = (event_codes == code) & (event_rows >= 0)
+        matrix[:, column] = np.bincount(event_rows[keep], minlength=total)
+        column += 1
+
+    # Time from the last event (at or before the end of the epoch) in the same night
+    keys = np.sort(event_nights * NIGHT_SHIFT + event_ms)
+    ends = starts + epoch_ms
+    found = np.searchsorted(keys, row_nights * NIGHT_SHIFT + ends - 1, side="right") - 1
+    previous = keys[np.clip(found, 0, None)] if len(keys) else np.zeros(total, dtype=np.int64)
+    same_night = (found >= 0) & (previous // NIGHT_SHIFT == row_nights)
+    matrix[:, column] = np.where(same_night, (ends - previous % NIGHT_SHIFT) / 1000, np.nan)
+    column += 1
+
+    # Sensor means, trailing window means and slopes. x is minutes since the night's first epoch.
+    sensor_rows = rows_of(sensor_nights, sensor_ms)
+    in_range = sensor_rows >= 0
+    sensor_rows = sensor_rows[in_range]
+    x = (sensor_ms[in_range] - first_epoch[sensor_nights[in_range]] * epoch_ms) / 60000
+    window_start = np.maximum(np.arange(total) - window_epochs + 1, night_start)
+
+    def window_sum(per_epoch):
+        prefix = np.concatenate([[0.0], np.cumsum(per_epoch)])
+        return prefix[np.arange(total) + 1] - prefix[window_start]
+
+    for name in SENSOR_COLUMNS:
+        y = sensors[name].to_numpy(dtype=np.float64)[in_range]
+        present = ~np.isnan(y)
+        rows, xs, ys = sensor_rows[present], x[present], y[present]
+        n = np.bincount(rows, minlength=total).astype(np.float64)
+        sum_y = np.bincount(rows, weights=ys, minlength=total)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            matrix[:, column] = sum_y / n
+            wn, wx, wy = window_sum(n), window_sum(np.bincount(rows, weights=xs, minlength=total)), window_sum(sum_y)
+            wxx = window_sum(np.bincount(rows, weights=xs * xs, minlength=total))
+            wxy = window_sum(np.bincount(rows, weights=xs * ys, minlength=total))
+            matrix[:, column + 1] = wy / wn
+            spread = wn * wxx - wx * wx
+            matrix[:, column + 2] = np.where((wn >= 2) & (spread > 0), (wn * wxy - wx * wy) / spread, np.nan)
+        column += 3
+
+    # Labels from ground truth and journal latency, judged at the middle of the epoch
+    bed = dataset.nights["bed_time"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    wake = dataset.nights["wake_time"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    known = ~np.isnat(dataset.nights["bed_time"].to_numpy()) & ~np.isnat(dataset.nights["wake_time"].to_numpy())
+    latency = dataset.nights["latency"].to_numpy(dtype=np.float64)
+    known &= ~np.isnan(latency)
+    onset = bed + np.nan_to_num(latency * 60000).astype(np.int64)
+    middle = starts + epoch_ms // 2
+    asleep = (middle >= onset[row_nights]) & (middle < wake[row_nights])
+    labels = np.where(known[row_nights], asleep, np.nan).astype(np.float32)
+
+    return EpochFeatures(np.ascontiguousarray(matrix), labels, night_names, row_nights, starts, epoch_seconds,
+                         window_epochs)
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+# Vectorized time matching across nights. Rows are sorted once by a composite
+# (night, time) integer key, so nearest / before / after lookups and window counts
+# for any number of anchor times are a single np.searchsorted call that never
+# crosses into another night.
+
+NIGHT_SHIFT = np.int64(2 ** 43)  # milliseconds per night slot (~278 years)
+
+
+def to_millis(times):
+    values = pd.to_datetime(pd.Series(np.asarray(times))).to_numpy(dtype="datetime64[ms]")
+    return values.astype(np.int64), ~np.isnat(values)
+
+
+class EventMatcher:
+    def __init__(self, frame, time_column="timestamp", night_column="night"):
+        self.frame = frame
+        nights = frame[night_column].astype(str).to_numpy()
+        self.night_codes = {night: code for code, night in enumerate(np.unique(nights))}
+        millis, valid = to_millis(frame[time_column])
+
+        codes = np.array([self.night_codes[night] for night in nights], dtype=np.int64)
+        keys = codes * NIGHT_SHIFT + millis
+        positions = np.flatnonzero(valid)
+        order = positions[np.argsort(keys[positions], kind="stable")]
+
+        self.keys = keys[order]
+        self.millis = millis[order]
+        self.codes = codes[order]
+        self.positions = order  # row positions (iloc) in the original frame
+
+    def has_night(self, night):
+        return str(night) in self.night_codes
+
+    def anchor_keys(self, nights, times):
+        millis, valid = to_millis(times)
+        codes = np.array([self.night_codes.get(str(night), -1) for night in nights], dtype=np.int64)
+        valid &= codes >= 0
+        return np.where(valid, codes * NIGHT_SHIFT + millis, 0), codes, valid
+
+    def nearest(self, nights, times, direction="nearest"):
+        # For each (night, time) anchor return the matching row's position in the
+        # original frame (-1 if none), its time and the signed delta (match - anchor).
+        # direction: "nearest", "backward" (at or before) or "forward" (at or after).
+        keys, codes, valid = self.anchor_keys(nights, times)
+        last = len(self.keys) - 1
+
+        before = np.searchsorted(self.keys, keys, side="right") - 1
+        after = np.searchsorted(self.keys, keys, side="left")
+        if last < 0:
+            before_ok = after_ok = np.zeros(len(keys), dtype=bool)
+        else:
+            before_ok = valid & (before >= 0) & (self.codes[np.clip(before, 0, last)] == codes)
+            after_ok = valid & (after <= last) & (self.codes[np.clip(after, 0, last)] == codes)
+
+        if direction == "backward":
+            index, found = before, before_ok
+        elif direction == "forward":
+            index, found = after, after_ok
+        elif direction == "nearest":
+            far = np.iinfo(np.int64).max
+            before_gap = np.where(before_ok, keys - self.keys[np.clip(before, 0, last)] if last >= 0 else 0, far)
+            after_gap = np.where(after_ok, self.keys[np.clip(after, 0, last)] - keys if last >= 0 else 0, far)
+            index = np.where(after_gap < before_gap, after, before)
+            found = before_ok | after_ok
+        else:
+            raise ValueError(f"Unknown direction: {direction}")
+
+        index = np.clip(index, 0, max(last, 0))
+        nat = np.iinfo(np.int64).min
+        matched = np.where(found, self.millis[index] if last >= 0 else nat, nat)
+        anchor_millis = keys - codes * NIGHT_SHIFT
+        return pd.DataFrame({
+            "position": np.where(found, self.positions[index] if last >= 0 else -1, -1),
+            "matched_time": pd.to_datetime(matched.astype("datetime64[ms]")),
+            "delta": pd.to_timedelta(np.where(found, matched - anchor_millis, nat).astype("timedelta64[ms]")),
+        }, index=getattr(times, "index", None))
+
+    def bounds(self, nights, starts, ends):
+        start_keys, codes, start_valid = self.anchor_keys(nights, starts)
+        end_keys, _, end_valid = self.anchor_keys(nights, ends)
+        valid = start_valid & end_valid
+        lo = np.searchsorted(self.keys, start_keys, side="left")
+        hi = np.searchsorted(self.keys, end_keys, side="right")
+        return np.where(valid, lo, 0), np.where(valid, np.maximum(hi, lo), 0)
+
+    def count_between(self, nights, starts, ends):
+        # Number of rows with start <= time <= end in the anchor's night
+        lo, hi = self.bounds(nights, starts, ends)
+        return hi - lo
+
+    def count_within(self, nights, times, before, after=None):
+        # Number of rows within [time - before, time + after]
+        times = pd.to_datetime(pd.Series(np.asarray(times)))
+        after = before if after is None else after
+        return self.count_between(nights, times - pd.Timedelta(before), times + pd.Timedelta(after))
+
+    def window_means(self, nights, starts, ends, columns):
+        # Mean of each column over [start, end] per anchor via prefix sums (NaN when empty)
+        lo, hi = self.bounds(nights, starts, ends)
+        values = self.frame[columns].to_numpy(dtype=np.float64)[self.positions]
+        present = ~np.isnan(values)
+        sums = np.vstack([np.zeros(len(columns)), np.cumsum(np.where(present, values, 0.0), axis=0)])
+        counts = np.vstack([np.zeros(len(columns)), np.cumsum(present, axis=0)])
+        window_counts = counts[hi] - counts[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (sums[hi] - sums[lo]) / window_counts
+        return pd.DataFrame(np.where(window_counts > 0, means, np.nan), columns=columns,
+                            index=getattr(starts, "index", None))
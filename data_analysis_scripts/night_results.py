@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from dataset_loader import SENSOR_COLUMNS, list_nights, load_dataset, night_signature, source_names
+from event_matching import EventMatcher
+
+# Per-night intermediate results (journal latency/quality, bed->wake event counts,
+# sensor averages over the sleep onset window, nearest-event deltas) memoized on
+# disk. Each entry is keyed by a hash of the night's source files and tracked in
+# manifest.json, so a re-run only computes nights that are new or changed.
+
+RESULTS_VERSION = 1
+DEFAULT_RESULTS_DIR = os.path.join(".cache", "results")
+
+FLAG_COLUMNS = ["has_sensor_data", "has_sleep_events", "has_ground_truth", "has_journal", "melatonin", "unisom"]
+TIME_COLUMNS = ["bed_time", "wake_time"]
+
+
+def content_key(dir_path):
+    digest = hashlib.sha256(f"night-results-v{RESULTS_VERSION}".encode())
+    for name in source_names(dir_path):
+        path = os.path.join(dir_path, name)
+        digest.update(name.encode())
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        else:
+            digest.update(b"\0missing")
+    return digest.hexdigest()
+
+
+def compute_night_results(dataset, nights):
+    # All requested nights are computed together with one matcher query per metric
+    table = dataset.nights.loc[nights]
+    events = EventMatcher(dataset.events)
+    sensors = EventMatcher(dataset.sensors)
+
+    onset_times = table["bed_time"] + pd.to_timedelta(table["latency"], unit="min")
+    onset_event = events.nearest(table.index, onset_times)
+    wake_event = events.nearest(table.index, table["wake_time"])
+
+    # Sensor averages over [bed time, bed time + latency], nearest reading if the window is empty
+    onset_sensors = sensors.window_means(table.index, table["bed_time"], onset_times, SENSOR_COLUMNS)
+    empty = onset_sensors.isna().all(axis=1)
+    if empty.any():
+        nearest = sensors.nearest(table.index[empty], onset_times[empty])
+        found = nearest["position"] >= 0
+        rows = dataset.sensors.iloc[nearest.loc[found, "position"]][SENSOR_COLUMNS]
+        onset_sensors.loc[nearest.index[found], SENSOR_COLUMNS] = rows.to_numpy()
+
+    results = pd.DataFrame({
+        "ground_truth_count": table["ground_truth_count"],
+        "latency": table["latency"],
+        "quality": table["quality"],
+        "duration": table["duration"],
+        "event_count": [len(dataset.for_night("events", night)) for night in table.index],
+        "bed_wake_event_count": events.count_between(table.index, table["bed_time"], table["wake_time"]),
+        "onset_event_delta": onset_event["delta"].abs() / pd.Timedelta(minutes=1),
+        "wake_event_delta": wake_event["delta"].abs() / pd.Timedelta(minutes=1),
+    }, index=table.index)
+    for column in FLAG_COLUMNS:
+        results[column] = table[column].astype(bool)
+    for column in TIME_COLUMNS:
+        results[column] = table[column].astype(str)
+    for column in SENSOR_COLUMNS:
+        results[f"onset_{column}"] = onset_sensors[column]
+
+    return {night: {key: (value.item() if hasattr(value, "item") else value) for key, value in row.items()}
+            for night, row in results.iterrows()}
+
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:
+        return default
+
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def remove_entry(results_dir, key):
+    path = os.path.join(results_dir, f"{key}.json")
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_night_results(top_dir="sleep_data", results_dir=DEFAULT_RESULTS_DIR, jobs=1):
+    os.makedirs(results_dir, exist_ok=True)
+    manifest_path = os.path.join(results_dir, "manifest.json")
+    manifest = read_json(manifest_path, {})
+    if manifest.get("version") != RESULTS_VERSION or manifest.get("top_dir") != os.path.abspath(top_dir):
+        manifest = {"version": RESULTS_VERSION, "top_dir": os.path.abspath(top_dir), "nights": {}}
+    entries = manifest["nights"]
+
+    results = {}
+    missing = []
+    for night in list_nights(top_dir):
+        dir_path = os.path.join(top_dir, night)
+        signature = [list(item) for item in night_signature(dir_path)]
+        entry = entries.get(night)
+        # Unchanged mtimes/sizes skip re-hashing; otherwise the content hash decides
+        if entry is None or entry["signature"] != signature:
+            key = content_key(dir_path)
+            if entry is not None and entry["key"] == key:
+                entry["signature"] = signature
+            else:
+                if entry is not None:
+                    remove_entry(results_dir, entry["key"])
+                entry = {"key": key, "signature": signature}
+                entries[night] = entry
+        cached = read_json(os.path.join(results_dir, f"{entry['key']}.json"), None)
+        if cached is None:
+            missing.append(night)
+        else:
+            results[night] = cached
+
+    if missing:
+        dataset = load_dataset(top_dir, jobs=jobs)
+        computed = compute_night_results(dataset, [night for night in missing if night in dataset.nights.index])
+        for night, values in computed.items():
+            write_json(os.path.join(results_dir, f"{entries[night]['key']}.json"), values)
+            results[night] = values
+
+    for night in set(entries) - set(results):
+        remove_entry(results_dir, entries.pop(night)["key"])
+    write_json(manifest_path, manifest)
+
+    frame = pd.DataFrame.from_dict(results, orient="index").sort_index()
+    frame.index.name = "night"
+    frame["date"] = pd.to_datetime(frame.index)
+    for column in TIME_COLUMNS:
+        frame[column] = pd.to_datetime(frame[column])
+    return frame
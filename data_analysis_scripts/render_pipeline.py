@@ -0,0 +1,100 @@
+import hashlib
+import inspect
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from night_results import read_json, write_json
+
+# Figure rendering for the analysis scripts. A figure job is an output path, a
+# module-level draw function that plots onto a fresh pyplot figure, and the data it
+# needs. Each job is keyed by a hash of its data and the draw function's source;
+# figures whose key matches the manifest (.cache/figures.json) and whose file still
+# exists are skipped. The rest are drawn with the Agg backend, in a process pool
+# when there is more than one, and saved through a temporary file so an
+# interrupted run never leaves a half-written PNG behind.
+
+RENDER_VERSION = 1
+DEFAULT_MANIFEST = os.path.join(".cache", "figures.json")
+
+_sources = {}
+
+
+class Figure:
+    def __init__(self, path, draw, *args):
+        self.path = path
+        self.draw = draw
+        self.args = args
+
+    def key(self):
+        source = _sources.get(self.draw)
+        if source is None:
+            source = _sources[self.draw] = inspect.getsource(self.draw)
+        digest = hashlib.sha256(f"figure-v{RENDER_VERSION}".encode())
+        digest.update(source.encode())
+        digest.update(pickle.dumps(self.args, protocol=4))
+        return digest.hexdigest()
+
+
+def draw_figure(path, draw, args):
+    # Returns None, or the error as a string so it survives the trip back from a worker
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{extension}"
+    try:
+        draw(*args)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        plt.savefig(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return str(e)
+    finally:
+        plt.close("all")
+    return None
+
+
+def render(figures, jobs=1, manifest_path=DEFAULT_MANIFEST):
+    # Draws the figures that changed; returns (rendered, unchanged) counts
+    manifest = read_json(manifest_path, {})
+    if manifest.get("version") != RENDER_VERSION:
+        manifest = {"version": RENDER_VERSION, "figures": {}}
+    entries = manifest["figures"]
+
+    pending = []
+    for figure in figures:
+        key = figure.key()
+        name = os.path.normpath(figure.path)
+        if entries.get(name) == key and os.path.exists(figure.path):
+            continue
+        pending.append((figure, name, key))
+
+    paths = [figure.path for figure, _, _ in pending]
+    draws = [figure.draw for figure, _, _ in pending]
+    args = [figure.args for figure, _, _ in pending]
+    if jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as pool:
+            errors = list(pool.map(draw_figure, paths, draws, args))
+    else:
+        errors = [draw_figure(*job) for job in zip(paths, draws, args)]
+
+    rendered = 0
+    for (figure, name, key), error in zip(pending, errors):
+        if error is not None:
+            entries.pop(name, None)
+            print(f"Error rendering {figure.path}: {error}")
+            continue
+        entries[name] = key
+        rendered += 1
+        print(f"Saved: {figure.path}")
+    unchanged = len(figures) - len(pending)
+    if unchanged:
+        print(f"Unchanged: {unchanged} figure{'s' if unchanged != 1 else ''}")
+
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    write_json(manifest_path, manifest)
+    return rendered, unchanged
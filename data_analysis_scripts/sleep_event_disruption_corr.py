@@ -1,61 +1,21 @@
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime
-import re
-from scipy.stats import pearsonr
+from night_results import load_night_results
+from render_pipeline import Figure, render
 
 
-def compute_event_latency_correlation(top_dir):
-    latencies = []
-    event_counts = []
+def compute_event_latency_correlation(top_dir, jobs=1):
+    from scipy.stats import pearsonr
 
     skip_dates = {"2025-05-19", "2025-05-20", "2025-05-21", "2025-05-22", "2025-05-23"}
 
-    for entry in os.listdir(top_dir):
-        if entry in skip_dates:
-            continue
+    nights = load_night_results(top_dir)
+    eligible = nights[~nights.index.isin(skip_dates)
+                      & nights["has_ground_truth"] & nights["has_journal"] & nights["has_sleep_events"]
+                      & (nights["ground_truth_count"] >= 2) & nights["latency"].notna()
+                      & (nights["event_count"] > 0)]
 
-        dir_path = os.path.join(top_dir, entry)
-        if not os.path.isdir(dir_path) or not re.match(r"\d{4}-\d{2}-\d{2}", entry):
-            continue
-
-        ground_truth_path = os.path.join(dir_path, "ground_truth_log.csv")
-        journal_path = os.path.join(dir_path, "journal.txt")
-        sleep_event_path = os.path.join(dir_path, "sleep_event_log.csv")
-
-        if not (os.path.exists(ground_truth_path) and os.path.exists(journal_path) and os.path.exists(sleep_event_path)):
-            continue
-
-        try:
-            # Read ground truth
-            gt_df = pd.read_csv(ground_truth_path, parse_dates=['timestamp'])
-            if len(gt_df) < 2:
-                continue
-            bed_time = gt_df.iloc[0]['timestamp']
-            wake_time = gt_df.iloc[1]['timestamp']
-
-            # Read latency
-            with open(journal_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            match = re.search(r"Sleep Onset Latency:\s*([\d.]+)", content)
-            if not match:
-                continue
-            latency = float(match.group(1))
-
-            # Count sleep events within bed-wake window
-            event_df = pd.read_csv(sleep_event_path, parse_dates=['timestamp'])
-            if event_df.empty:
-                continue
-
-
-            event_count = ((event_df['timestamp'] >= bed_time) & (event_df['timestamp'] <= wake_time)).sum()
-
-            latencies.append(latency)
-            event_counts.append(event_count)
-
-        except Exception as e:
-            print(f"Error processing {entry}: {e}")
+    # Sleep events within bed-wake window
+    latencies = list(eligible["latency"])
+    event_counts = list(eligible["bed_wake_event_count"])
 
     # Correlation calculation
     if len(latencies) > 1 and len(event_counts) > 1:
@@ -66,6 +26,12 @@ def compute_event_latency_correlation(top_dir):
         print("Not enough data to compute correlation.")
 
     # Plot for visual inspection
+    render([Figure("images/event_latency_correlation.png", draw_event_latency, event_counts, latencies)], jobs)
+
+
+def draw_event_latency(event_counts, latencies):
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(6, 5))
     plt.scatter(event_counts, latencies, color='steelblue')
     plt.title("Sleep Onset Latency vs. Sleep Event Count")
@@ -73,10 +39,11 @@ def compute_event_latency_correlation(top_dir):
     plt.ylabel("Sleep Onset Latency (minutes)")
     plt.grid(True)
     plt.tight_layout()
-    os.makedirs("../images", exist_ok=True)
-    plt.savefig("images/event_latency_correlation.png")
-    plt.close()
-    print("Saved: images/event_latency_correlation.png")
 
-top_directory = "sleep_data"
-compute_event_latency_correlation(top_directory)
+
+def main(top_dir="sleep_data", jobs=1):
+    compute_event_latency_correlation(top_dir, jobs=jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,32 @@
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
-import re
+from night_results import load_night_results
+from render_pipeline import Figure, render
 
 
 def compute_event_sleep_differences(top_dir):
-    differences = {}
+    nights = load_night_results(top_dir)
 
-    for entry in os.listdir(top_dir):
-        if entry == "2025-05-23":
-            continue  # Skip this night
+    # Distance from real sleep time (bed time + journal latency) to the nearest sleep event
+    eligible = nights[(nights.index != "2025-05-23")  # Skip this night
+                      & nights["has_ground_truth"] & nights["has_journal"] & nights["has_sleep_events"]
+                      & (nights["ground_truth_count"] >= 1) & nights["latency"].notna()
+                      & nights["onset_event_delta"].notna()]
 
-        dir_path = os.path.join(top_dir, entry)
-        if not os.path.isdir(dir_path) or not re.match(r"\d{4}-\d{2}-\d{2}", entry):
-            continue
+    return dict(sorted(zip(eligible["date"], eligible["onset_event_delta"])))
 
-        ground_truth_path = os.path.join(dir_path, "ground_truth_log.csv")
-        journal_path = os.path.join(dir_path, "journal.txt")
-        sleep_event_path = os.path.join(dir_path, "sleep_event_log.csv")
+def draw_event_sleep_differences(dates, values):
+    import matplotlib.pyplot as plt
 
-        if not (os.path.exists(ground_truth_path) and os.path.exists(journal_path) and os.path.exists(sleep_event_path)):
-            continue
-
-        try:
-            # 1. Get bed time
-            gt_df = pd.read_csv(ground_truth_path, parse_dates=['timestamp'])
-            if len(gt_df) < 1:
-                continue
-            bed_time = gt_df.iloc[0]['timestamp']
-
-            # 2. Get latency from journal
-            with open(journal_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            match = re.search(r"Sleep Onset Latency:\s*([\d.]+)", content)
-            if not match:
-                continue
-            latency_minutes = float(match.group(1))
-
-            # 3. Compute real sleep time
-            sleep_time = bed_time + timedelta(minutes=latency_minutes)
-
-            # 4. Get nearest sleep event
-            event_df = pd.read_csv(sleep_event_path, parse_dates=['timestamp'])
-            if event_df.empty:
-                continue
-            event_df['time_diff'] = (event_df['timestamp'] - sleep_time).abs()
-            closest_event = event_df.loc[event_df['time_diff'].idxmin()]
-            diff_minutes = abs((closest_event['timestamp'] - sleep_time).total_seconds()) / 60.0
-
-            differences[datetime.strptime(entry, "%Y-%m-%d")] = diff_minutes
-
-        except Exception as e:
-            print(f"Error processing {entry}: {e}")
+    plt.figure(figsize=(10, 5))
+    plt.plot(dates, values, marker='o', linestyle='-', color='darkgreen')
+    plt.title("Difference Between Real Sleep Time and Nearest Sleep Event")
+    plt.xlabel("Date")
+    plt.ylabel("Difference (minutes)")
+    plt.grid(True)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
 
-    return dict(sorted(differences.items()))
 
-def plot_event_sleep_differences(differences, output_path="images/event_sleep_differences.png"):
+def plot_event_sleep_differences(differences, output_path="images/event_sleep_differences.png", jobs=1):
     if not differences:
         print("No sleep time differences to plot.")
         return
@@ -70,20 +40,13 @@ def plot_event_sleep_differences(differences, output_path="images/event_sleep_di
     avg_diff = sum(values) / len(values)
     print(f"\nAverage difference: {avg_diff:.2f} minutes")
 
-    plt.figure(figsize=(10, 5))
-    plt.plot(dates, values, marker='o', linestyle='-', color='darkgreen')
-    plt.title("Difference Between Real Sleep Time and Nearest Sleep Event")
-    plt.xlabel("Date")
-    plt.ylabel("Difference (minutes)")
-    plt.grid(True)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    render([Figure(output_path, draw_event_sleep_differences, dates, values)], jobs)
+
+
+def main(top_dir="sleep_data", jobs=1):
+    sleep_diffs = compute_event_sleep_differences(top_dir)
+    plot_event_sleep_differences(sleep_diffs, jobs=jobs)
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    plt.savefig(output_path)
-    plt.close()
-    print(f"Saved: {output_path}")
 
-top_directory = "sleep_data"
-sleep_diffs = compute_event_sleep_differences(top_directory)
-plot_event_sleep_differences(sleep_diffs)
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,31 @@
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime
-import re
+from night_results import load_night_results
+from render_pipeline import Figure, render
 
 
 def compute_event_wake_differences(top_dir):
-    differences = {}  # {date: time_difference_in_minutes}
+    nights = load_night_results(top_dir)
 
-    for entry in os.listdir(top_dir):
-        if entry == "2025-05-23":
-            continue  # Skip this night
+    # Distance from wake time to the closest event
+    eligible = nights[(nights.index != "2025-05-23")  # Skip this night
+                      & nights["has_ground_truth"] & nights["has_sleep_events"]
+                      & (nights["ground_truth_count"] >= 2) & nights["wake_event_delta"].notna()]
 
-        dir_path = os.path.join(top_dir, entry)
-        if not os.path.isdir(dir_path) or not re.match(r"\d{4}-\d{2}-\d{2}", entry):
-            continue
+    return dict(sorted(zip(eligible["date"], eligible["wake_event_delta"])))  # {date: time_difference_in_minutes}
 
-        ground_truth_path = os.path.join(dir_path, "ground_truth_log.csv")
-        sleep_event_path = os.path.join(dir_path, "sleep_event_log.csv")
+def draw_event_wake_differences(dates, values):
+    import matplotlib.pyplot as plt
 
-        if not os.path.exists(ground_truth_path) or not os.path.exists(sleep_event_path):
-            continue
-
-        try:
-            # Get wake time
-            gt_df = pd.read_csv(ground_truth_path, parse_dates=['timestamp'])
-            if len(gt_df) < 2:
-                continue
-            wake_time = gt_df.iloc[1]['timestamp']
-
-            # Get closest event
-            event_df = pd.read_csv(sleep_event_path, parse_dates=['timestamp'])
-            if event_df.empty:
-                continue
-
-            event_df['time_diff'] = (event_df['timestamp'] - wake_time).abs()
-            closest_event = event_df.loc[event_df['time_diff'].idxmin()]
-            diff_minutes = abs((closest_event['timestamp'] - wake_time).total_seconds()) / 60.0
-
-            differences[datetime.strptime(entry, "%Y-%m-%d")] = diff_minutes
-
-        except Exception as e:
-            print(f"Error processing {entry}: {e}")
+    plt.figure(figsize=(10, 5))
+    plt.plot(dates, values, marker='o', linestyle='-', color='crimson')
+    plt.title("Difference Between Wake Time and Nearest Sleep Event")
+    plt.xlabel("Date")
+    plt.ylabel("Difference (minutes)")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.xticks(rotation=45)
 
-    return dict(sorted(differences.items()))
 
-def plot_event_wake_differences(differences, output_path="images/event_wake_differences.png"):
+def plot_event_wake_differences(differences, output_path="images/event_wake_differences.png", jobs=1):
     if not differences:
         print("No differences to plot.")
         return
@@ -60,21 +40,13 @@ def plot_event_wake_differences(differences, output_path="images/event_wake_diff
     avg_diff = sum(values) / len(values)
     print(f"\nAverage difference: {avg_diff:.2f} minutes")
 
-    # Plot
-    plt.figure(figsize=(10, 5))
-    plt.plot(dates, values, marker='o', linestyle='-', color='crimson')
-    plt.title("Difference Between Wake Time and Nearest Sleep Event")
-    plt.xlabel("Date")
-    plt.ylabel("Difference (minutes)")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.xticks(rotation=45)
+    render([Figure(output_path, draw_event_wake_differences, dates, values)], jobs)
+
+
+def main(top_dir="sleep_data", jobs=1):
+    diffs = compute_event_wake_differences(top_dir)
+    plot_event_wake_differences(diffs, jobs=jobs)
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    plt.savefig(output_path)
-    plt.close()
-    print(f"Saved: {output_path}")
 
-top_directory = "sleep_data"
-diffs = compute_event_wake_differences(top_directory)
-plot_event_wake_differences(diffs)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import numpy as np
+
+SENSOR_COLUMNS = ["temperature", "humidity", "heat_index", "light", "sound"]
+
+
+def min_max_indices(values, max_points):
+    # values is an (n, k) array. Rows are split into equal buckets and, for every
+    # column, the rows holding the bucket's min and max are kept (plus the first
+    # and last row), so peaks and dips survive while the output stays <= max_points.
+    n, k = values.shape
+    if n <= max_points:
+        return np.arange(n)
+
+    buckets = max(1, (max_points - 2) // (2 * k))
+    size = -(-n // buckets)
+    buckets = -(-n // size)
+    padded = np.full((buckets * size, k), np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size, k)
+
+    offsets = (np.arange(buckets) * size)[:, None]
+    low = np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1) + offsets
+    high = np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1) + offsets
+
+    keep = np.concatenate([low.ravel(), high.ravel(), [0, n - 1]])
+    return np.unique(keep[keep < n])
+
+
+def downsample_rows(rows, max_points, columns=SENSOR_COLUMNS):
+    if max_points is None or len(rows) <= max_points:
+        return rows
+    values = np.array([[row[column] if row[column] != "" else "nan" for column in columns] for row in rows], dtype=float)
+    return [rows[i] for i in min_max_indices(values, max_points)]
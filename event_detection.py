@@ -0,0 +1,173 @@
+import numpy as np
+
+# Server-side versions of the firmware detectors in sleep_monitor.ino, run over
+# chunks of raw analog samples with NumPy. State (the trailing window, debounce
+# and light hold values) carries over between chunks, so a stream split into
+# chunks produces the same events as one long array.
+
+# Defaults match the firmware; override with set_settings() / SLEEP_DETECTOR_SETTINGS
+DEFAULT_SETTINGS = {
+    "debounce_ms": 3000,
+    "sound_window": 100,
+    "sound_margin": 300,
+    "light_window": 100,
+    "light_hold_interval_ms": 1000,
+    "light_hold_change": 10,
+    "light_delta": 15,
+    "movement_window": 1000,
+    "movement_margin": 200,
+}
+
+
+def debounce(times, last_event, debounce_ms):
+    # Keep the first candidate and then only candidates more than debounce_ms after
+    # the previously kept one. Each step jumps straight to the next allowed
+    # candidate, so the loop runs once per emitted event rather than per sample.
+    kept = []
+    i = np.searchsorted(times, last_event + debounce_ms, side="right")
+    while i < len(times):
+        last_event = times[i]
+        kept.append(i)
+        i = np.searchsorted(times, last_event + debounce_ms, side="right")
+    return np.asarray(kept, dtype=np.int64), last_event
+
+
+class RollingWindow:
+    # Integer average of the `window` samples before each sample (the firmware
+    # updates its circular buffer after comparing), computed with a cumulative sum
+    # over the previous chunk's tail plus the new samples.
+
+    def __init__(self, window):
+        self.window = window
+        self.tail = np.zeros(0, dtype=np.int64)
+
+    def previous_averages(self, samples):
+        data = np.concatenate([self.tail, samples])
+        sums = np.concatenate([[0], np.cumsum(data)])
+        positions = np.arange(len(self.tail), len(data))
+        valid = positions >= self.window
+        averages = (sums[positions] - sums[np.maximum(positions - self.window, 0)]) // self.window
+        self.tail = data[-self.window:]
+        return averages, valid
+
+    def resize(self, window):
+        # Keeps the history that fits; a longer window is invalid until it has filled up again
+        self.window = window
+        self.tail = self.tail[-window:]
+
+
+class ThresholdDetector:
+    # sound_detection / movement_detection: sample > rolling average + margin
+
+    def __init__(self, window, margin, debounce_ms):
+        self.rolling = RollingWindow(window)
+        self.margin = margin
+        self.debounce_ms = debounce_ms
+        self.last_event = -np.inf
+
+    def process(self, samples, times):
+        averages, valid = self.rolling.previous_averages(samples)
+        candidates = np.flatnonzero(valid & (samples > averages + self.margin))
+        kept, self.last_event = debounce(times[candidates], self.last_event, self.debounce_ms)
+        return times[candidates[kept]]
+
+
+class LightDetector:
+    # light_detection: the rolling average is compared with a sample-and-hold copy
+    # that is refreshed (at most once per hold interval) when the average has moved
+    # by more than hold_change; |average - held| > delta is a light event.
+
+    def __init__(self, window, hold_interval_ms, hold_change, delta, debounce_ms):
+        self.rolling = RollingWindow(window)
+        self.hold_interval_ms = hold_interval_ms
+        self.hold_change = hold_change
+        self.delta = delta
+        self.debounce_ms = debounce_ms
+        # Seeded from the first valid average. The firmware's setup() delay means its
+        # hold interval has always passed by the first sample, so it refreshes there too.
+        self.held = None
+        self.held_time = -np.inf
+        self.last_event = -np.inf
+
+    def held_values(self, averages, times):
+        # The held value only changes at refresh points (at most one per hold
+        # interval), so walk refresh to refresh with vectorized searches in between
+        held = np.empty(len(averages), dtype=np.int64)
+        if self.held is None and len(averages):
+            self.held = averages[0]
+            self.held_time = times[0]
+        start = 0
+        while start < len(averages):
+            first = start + np.searchsorted(times[start:], self.held_time + self.hold_interval_ms, side="right")
+            changed = np.flatnonzero(np.abs(averages[first:] - self.held) > self.hold_change)
+            if len(changed) == 0:
+                held[start:] = self.held
+                break
+            refresh = first + changed[0]
+            held[start:refresh] = self.held
+            self.held = averages[refresh]
+            self.held_time = times[refresh]
+            start = refresh
+        return held
+
+    def process(self, samples, times):
+        averages, valid = self.rolling.previous_averages(samples)
+        averages, times_valid = averages[valid], times[valid]
+        held = self.held_values(averages, times_valid)
+        candidates = np.flatnonzero(np.abs(averages - held) > self.delta)
+        kept, self.last_event = debounce(times_valid[candidates], self.last_event, self.debounce_ms)
+        return times_valid[candidates[kept]]
+
+
+class RawSampleDetector:
+    # One stream of raw samples from a device: sound, light and movement (x + y + z)
+
+    def __init__(self, settings=None):
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        s = self.settings
+        self.detectors = {
+            "SOUND": ThresholdDetector(s["sound_window"], s["sound_margin"], s["debounce_ms"]),
+            "LIGHT": LightDetector(s["light_window"], s["light_hold_interval_ms"], s["light_hold_change"],
+                                   s["light_delta"], s["debounce_ms"]),
+            "MOVEMENT": ThresholdDetector(s["movement_window"], s["movement_margin"], s["debounce_ms"]),
+        }
+        self.next_millis = 0.0
+
+    def update_settings(self, settings):
+        # Everything applies from the next chunk; resized windows keep the samples that still fit
+        self.settings.update(settings)
+        s = self.settings
+        for name in ("SOUND", "LIGHT", "MOVEMENT"):
+            rolling = self.detectors[name].rolling
+            if rolling.window != s[f"{name.lower()}_window"]:
+                rolling.resize(s[f"{name.lower()}_window"])
+        for name in ("SOUND", "MOVEMENT"):
+            detector = self.detectors[name]
+            detector.margin = s[f"{name.lower()}_margin"]
+            detector.debounce_ms = s["debounce_ms"]
+        light = self.detectors["LIGHT"]
+        light.hold_interval_ms = s["light_hold_interval_ms"]
+        light.hold_change = s["light_hold_change"]
+        light.delta = s["light_delta"]
+        light.debounce_ms = s["debounce_ms"]
+
+    def process(self, sample_rate, sound=(), light=(), movement=(), start_millis=None):
+        # Returns (event name, device millis) pairs sorted by time and the millis of
+        # the chunk's first and last samples
+        channels = {"SOUND": sound, "LIGHT": light, "MOVEMENT": movement}
+        lengths = {len(samples) for samples in channels.values() if len(samples)}
+        if len(lengths) > 1:
+            raise ValueError("sound, light and movement chunks must have the same number of samples")
+        n = lengths.pop() if lengths else 0
+
+        start = self.next_millis if start_millis is None else float(start_millis)
+        times = start + np.arange(n) * (1000.0 / sample_rate)
+        self.next_millis = start + n * (1000.0 / sample_rate)
+
+        events = []
+        for name, samples in channels.items():
+            if len(samples):
+                detected = self.detectors[name].process(np.asarray(samples, dtype=np.int64), times)
+                events.extend((name, float(t)) for t in detected)
+        events.sort(key=lambda event: event[1])
+        return events, start, (float(times[-1]) if n else start)
@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import time
+
+# Structured fields and an inverted term index over every night's journal.txt.
+# refresh() stats each journal and only re-reads the ones whose mtime or size
+# changed, so keyword and supplement lookups across all nights are a dict lookup.
+# With a path, the index is also kept in a JSON file between runs.
+
+INDEX_VERSION = 1
+
+JOURNAL_FIELDS = {
+    "latency": re.compile(r"Sleep Onset Latency:\s*([\d.]+)"),
+    "quality": re.compile(r"Sleep Quality:\s*([\d.]+)"),
+    "duration": re.compile(r"Sleep Duration:\s*([\d.]+)"),
+}
+KEYWORDS = ["melatonin", "unisom"]
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def parse_fields(content):
+    # None for fields that are missing or not a number
+    fields = {}
+    for field, pattern in JOURNAL_FIELDS.items():
+        match = pattern.search(content)
+        try:
+            fields[field] = float(match.group(1)) if match else None
+        except ValueError:
+            fields[field] = None
+    return fields
+
+
+def journal_terms(content):
+    return sorted(set(TERM_PATTERN.findall(content.lower())))
+
+
+class JournalIndex:
+
+    def __init__(self, root, path=None, max_age=1.0):
+        self.root = root
+        self.path = path
+        # How long a refresh stays current before journals are stat'ed again
+        self.max_age = max_age
+        self.entries = {}
+        self.postings = {}
+        self.checked = None
+        if path is not None:
+            self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable journal index {self.path}: {e}")
+            return
+        if saved.get("version") != INDEX_VERSION or saved.get("root") != os.path.abspath(self.root):
+            return
+        for night, entry in saved["nights"].items():
+            self.add(night, entry)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "root": os.path.abspath(self.root), "nights": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    def add(self, night, entry):
+        self.entries[night] = entry
+        for term in entry["terms"]:
+            self.postings.setdefault(term, set()).add(night)
+
+    def remove(self, night):
+        entry = self.entries.pop(night, None)
+        if entry is None:
+            return
+        for term in entry["terms"]:
+            nights = self.postings[term]
+            nights.discard(night)
+            if not nights:
+                del self.postings[term]
+
+    def refresh(self, force=False):
+        if not force and self.checked is not None and time.monotonic() - self.checked < self.max_age:
+            return
+        self.checked = time.monotonic()
+
+        nights = os.listdir(self.root) if os.path.isdir(self.root) else []
+        seen = set()
+        changed = False
+        for night in nights:
+            file_path = os.path.join(self.root, night, "journal.txt")
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            seen.add(night)
+            signature = [stat.st_mtime_ns, stat.st_size]
+            entry = self.entries.get(night)
+            if entry is not None and entry["signature"] == signature:
+                continue
+
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            self.remove(night)
+            self.add(night, {"signature": signature, **parse_fields(content), "terms": journal_terms(content)})
+            changed = True
+
+        for night in set(self.entries) - seen:
+            self.remove(night)
+            changed = True
+        if changed and self.path is not None:
+            self.save()
+
+    def has_journal(self, night):
+        self.refresh()
+        return night in self.entries
+
+    def search(self, term):
+        # Nights whose journal contains every word of term (case-insensitive)
+        self.refresh()
+        words = TERM_PATTERN.findall(term.lower())
+        if not words:
+            return []
+        nights = set(self.postings.get(words[0], ()))
+        for word in words[1:]:
+            nights &= self.postings.get(word, set())
+        return sorted(nights)
+
+    def mentions(self, night, term):
+        self.refresh()
+        words = TERM_PATTERN.findall(term.lower())
+        return bool(words) and all(night in self.postings.get(word, ()) for word in words)
+
+    def summary(self, night):
+        self.refresh()
+        entry = self.entries.get(night)
+        if entry is None:
+            return None
+        terms = set(entry["terms"])
+        return {
+            "night": night,
+            **{field: entry[field] for field in JOURNAL_FIELDS},
+            **{keyword: keyword in terms for keyword in KEYWORDS},
+        }
+
+    def summaries(self):
+        self.refresh()
+        return [self.summary(night) for night in sorted(self.entries)]
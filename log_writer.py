@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+
+import metrics
+from rollups import ROLLUP_TABLES, Rollups, read_logs
+from storage import DEFAULT_DEVICE
+
+ROWS_WRITTEN = metrics.counter("sleep_rows_written_total", "Rows appended to storage by table", ["table"])
+WRITE_SECONDS = metrics.histogram("sleep_writer_write_seconds", "Time to append and flush one group of rows")
+WRITE_ERRORS = metrics.counter("sleep_writer_errors_total", "Failed shard appends and flushes")
+
+logger = logging.getLogger("sleep_sensor.ingest.writer")
+
+_STOP = object()
+
+
+class LogWriter:
+    # Single background task that owns the storage backend. Request handlers only
+    # enqueue rows; the writer appends them in groups (the CSV backend keeps every
+    # log open) and flushes once enough rows are buffered or the oldest buffered
+    # row is too old. All I/O runs in a worker thread so a slow disk never blocks
+    # the event loop. Rows are grouped per device and each device's shard is
+    # appended in its own thread, so one device's writes never wait on another's.
+    # The writer also keeps each device's rollups for the night and stores them
+    # with every flush. A failed append or flush is logged and its rows dropped;
+    # the writer keeps going with the next group.
+
+    def __init__(self, max_rows=256, flush_interval=1.0, max_queue=10000):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.storage = None
+        self.night = ""
+        self.queue = None
+        self.task = None
+        self.rollups = {}
+
+    def start(self, storage, night):
+        self.storage = storage
+        self.night = night
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.task = asyncio.create_task(self.run())
+        self.task.add_done_callback(self.stopped)
+
+    def stopped(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Log writer stopped, rows are no longer written", exc_info=task.exception())
+
+    async def put(self, table, rows, device=DEFAULT_DEVICE):
+        # Fail fast instead of filling a queue nobody drains
+        if self.task is not None and self.task.done():
+            raise RuntimeError("Log writer has stopped")
+        await self.queue.put((device, table, rows))
+
+    def queue_depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def run(self):
+        pending = {}
+        pending_rows = 0
+        oldest = None
+        stopping = False
+
+        while not stopping:
+            timeout = None
+            if oldest is not None:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - oldest))
+
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            # Drain whatever else is already queued so rows are written as one group
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                device, table, rows = item
+                pending.setdefault(device, {}).setdefault(table, []).extend(rows)
+                pending_rows += len(rows)
+                if oldest is None:
+                    oldest = time.monotonic()
+                item = self.queue.get_nowait() if not self.queue.empty() else None
+
+            due = oldest is not None and time.monotonic() - oldest >= self.flush_interval
+            if pending and (stopping or due or pending_rows >= self.max_rows):
+                await self.write(pending)
+                pending = {}
+                pending_rows = 0
+                oldest = None
+
+        await asyncio.to_thread(self.storage.close)
+
+    async def close(self):
+        if self.task is None:
+            return
+        if self.task.done():
+            # Already stopped (and logged); just release the files
+            await asyncio.to_thread(self.storage.close)
+        else:
+            await self.queue.put(_STOP)
+            await self.task
+        self.task = None
+
+    async def write(self, pending):
+        start = time.perf_counter()
+        results = await asyncio.gather(*[asyncio.to_thread(self.append_shard, device, tables)
+                                         for device, tables in pending.items()], return_exceptions=True)
+        for (device, tables), result in zip(pending.items(), results):
+            if isinstance(result, Exception):
+                WRITE_ERRORS.inc()
+                rows = sum(len(table_rows) for table_rows in tables.values())
+                logger.error("Failed to write %d rows for device %s", rows, device, exc_info=result)
+        try:
+            await asyncio.to_thread(self.storage.flush)
+        except Exception:
+            WRITE_ERRORS.inc()
+            logger.exception("Failed to flush logs")
+        WRITE_SECONDS.observe(time.perf_counter() - start)
+
+    def append_shard(self, device, tables):
+        rollups = self.rollups.get(device)
+        if rollups is None:
+            # Start from whatever the night already has on disk (an earlier run, or
+            # rows written before rollups existed)
+            rollups = self.rollups[device] = Rollups.from_logs(read_logs(self.storage, self.night, device))
+        for table, rows in tables.items():
+            self.storage.append(table, self.night, rows, device)
+            ROWS_WRITTEN.inc(len(rows), table=table)
+            if table in ROLLUP_TABLES:
+                rollups.add(table, rows)
+        self.storage.write_rollups(self.night, device, rollups.to_json())
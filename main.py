@@ -1,82 +1,309 @@
-import os.path
-import csv
-from fastapi import FastAPI
-from pydantic import BaseModel
+import os
+import json
+from contextlib import asynccontextmanager
+from typing import Annotated, Optional, Union
+from fastapi import FastAPI, Query, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
 from datetime import datetime, date
 from enum import Enum
 import uvicorn
-app = FastAPI()
 
-parent_data_dir = "/home/edward/Projects/school/ece284/sleep_data"
-data_dir = ""
+import metrics
+from binary_ingest import body_format, sensor_rows, sleep_event_rows, unpack_msgpack
+from broadcast import Broadcaster
+from event_detection import DEFAULT_SETTINGS, RawSampleDetector
+from log_writer import LogWriter
+from storage import DEFAULT_DEVICE, DEVICE_ID_PATTERN, TABLES, open_storage
+
+logger = metrics.configure_logging("sleep_sensor.ingest")
+log_writer = LogWriter()
+broadcaster = Broadcaster()
+metrics.gauge("sleep_writer_queue_depth", "Batches waiting for the log writer", log_writer.queue_depth)
+metrics.gauge("sleep_stream_subscribers", "Connected /stream clients", lambda: len(broadcaster.subscribers))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    log_writer.start(open_storage(parent_data_dir), night)
+    yield
+    # End live streams, then drain queued rows and close the log files before exiting
+    broadcaster.close()
+    await log_writer.close()
+
+app = FastAPI(lifespan=lifespan)
+# The dashboard is served from another port and subscribes to /stream directly
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET"])
+metrics.instrument(app, "ingest")
+
+parent_data_dir = os.environ.get("SLEEP_DATA_DIR", "/home/edward/Projects/school/ece284/sleep_data")
+night = ""
 class SleepEvent(Enum):
     LIGHT = 0
     SOUND = 1
     MOVEMENT = 2
 
+# Boards that don't send a device_id are the original single device
+DeviceId = Annotated[str, Field(pattern=f"^{DEVICE_ID_PATTERN.pattern}$")]
+
 class SensorData(BaseModel):
     temperature: float
     humidity: float
     heat_index: float
     light: int
     sound: int
+    # Optional device-side time (ISO string or epoch seconds), used by batched uploads
+    timestamp: Optional[datetime] = None
+    device_id: DeviceId = DEFAULT_DEVICE
 
 class SleepEventData(BaseModel):
     sleepEvent: int
+    timestamp: Optional[datetime] = None
+    device_id: DeviceId = DEFAULT_DEVICE
+
+class RawSampleChunk(BaseModel):
+    # Raw analogRead values sampled in lockstep; movement is x + y + z per sample
+    sample_rate: float = Field(gt=0)
+    sound: list[int] = []
+    light: list[int] = []
+    movement: list[int] = []
+    # Device millis() of the first sample, continues from the previous chunk if omitted
+    start_millis: Optional[float] = None
+    # Wall time of the first sample, otherwise the last sample is taken as "now"
+    timestamp: Optional[datetime] = None
+    device_id: DeviceId = DEFAULT_DEVICE
+
+# Window lengths are sample counts, everything else is a non-negative threshold or interval
+DetectorWindow = Annotated[int, Field(gt=0)]
+DetectorThreshold = Annotated[Union[int, float], Field(ge=0, allow_inf_nan=False)]
+
+class DetectorSettings(BaseModel):
+    debounce_ms: DetectorThreshold = DEFAULT_SETTINGS["debounce_ms"]
+    sound_window: DetectorWindow = DEFAULT_SETTINGS["sound_window"]
+    sound_margin: DetectorThreshold = DEFAULT_SETTINGS["sound_margin"]
+    light_window: DetectorWindow = DEFAULT_SETTINGS["light_window"]
+    light_hold_interval_ms: DetectorThreshold = DEFAULT_SETTINGS["light_hold_interval_ms"]
+    light_hold_change: DetectorThreshold = DEFAULT_SETTINGS["light_hold_change"]
+    light_delta: DetectorThreshold = DEFAULT_SETTINGS["light_delta"]
+    movement_window: DetectorWindow = DEFAULT_SETTINGS["movement_window"]
+    movement_margin: DetectorThreshold = DEFAULT_SETTINGS["movement_margin"]
+
+
+def validate_detector_settings(settings):
+    # Only the settings that were given, checked before they reach any detector (ValueError otherwise)
+    if not isinstance(settings, dict):
+        raise ValueError("Settings must be a JSON object")
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    return DetectorSettings(**settings).model_dump(exclude_unset=True)
+
+# Event detection for devices streaming raw samples, thresholds can be tuned without reflashing.
+# Each device has its own detector state.
+detector_settings = {**DEFAULT_SETTINGS,
+                     **validate_detector_settings(json.loads(os.environ.get("SLEEP_DETECTOR_SETTINGS", "{}")))}
+raw_detectors = {}
+
+def format_timestamp(timestamp: Optional[datetime] = None) -> str:
+    if timestamp is None:
+        timestamp = datetime.now()
+    elif timestamp.tzinfo is not None:
+        # Epoch and offset timestamps are stored in server local time like everything else
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def sensor_row(data: SensorData):
+    return [format_timestamp(data.timestamp), data.temperature, data.humidity, data.heat_index, data.light, data.sound]
+
+
+def sleep_event_row(data: SleepEventData):
+    return [format_timestamp(data.timestamp), SleepEvent(data.sleepEvent).name]
+
+
+async def store(table, rows, device=DEFAULT_DEVICE):
+    # Queue rows for the writer and push them to live subscribers
+    await log_writer.put(table, rows, device)
+    columns = TABLES[table][1]
+    broadcaster.publish(table, {"night": night, "device": device, "rows": [dict(zip(columns, row)) for row in rows]})
+
+
+def rows_by_device(readings, make_row):
+    shards = {}
+    for data in readings:
+        shards.setdefault(data.device_id, []).append(make_row(data))
+    return shards
+
+
+def parse_json_batch(body, content_type):
+    # Accepts either a JSON array or newline delimited JSON (one reading per line)
+    if "ndjson" in content_type or not body.lstrip().startswith(b"["):
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    return json.loads(body)
+
+
+async def read_shards(request: Request, model, make_row, struct_rows, device_id, batch):
+    # {device: rows} from a JSON (or ndjson) body, msgpack, or packed struct records
+    # (binary_ingest.py) which skip pydantic and carry the device in the query string
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    body_type = body_format(content_type)
+    if body_type == "struct":
+        rows = struct_rows(body)
+        if not batch and len(rows) != 1:
+            raise ValueError(f"Expected one record, got {len(rows)}")
+        return {device_id: rows} if rows else {}
+
+    if body_type == "msgpack":
+        items = unpack_msgpack(body)
+    elif batch:
+        items = parse_json_batch(body, content_type)
+    else:
+        items = json.loads(body)
+    return rows_by_device([model(**item) for item in (items if batch else [items])], make_row)
+
+
+def batch_error(error):
+    return JSONResponse(content={"error": f"Invalid batch: {error}"}, status_code=422)
+
+
+def reading_error(error):
+    return JSONResponse(content={"error": f"Invalid reading: {error}"}, status_code=422)
+
+
+def unsupported_body():
+    return JSONResponse(content={"error": "msgpack bodies need the msgpack package installed"}, status_code=415)
+
+
+DeviceQuery = Query(default=DEFAULT_DEVICE, pattern=f"^{DEVICE_ID_PATTERN.pattern}$")
+
 
 @app.post("/sensorData")
-async def receive_temp(data: SensorData):
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{now}] Temp: {data.temperature} °C | Humidity: {data.humidity} %")
-
-    file_path = f"{data_dir}/sensor_data_log.csv"
-    write_header = not os.path.exists(file_path)
-
-    with open(file_path, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        if write_header:
-            writer.writerow(["timestamp", "temperature", "humidity", "heat_index", "light", "sound"])
-        writer.writerow([now, data.temperature, data.humidity, data.heat_index, data.light, data.sound])
+async def receive_temp(request: Request, device_id: str = DeviceQuery):
+    try:
+        shards = await read_shards(request, SensorData, sensor_row, sensor_rows, device_id, batch=False)
+    except ImportError:
+        return unsupported_body()
+    except (ValueError, TypeError, ValidationError) as e:
+        return reading_error(e)
+
+    for device, rows in shards.items():
+        row = rows[0]
+        logger.debug("sensor_data timestamp=%s device=%s temperature=%s humidity=%s", row[0], device, row[1], row[2])
+        await store("sensor_data", rows, device)
     return {"status": "success"}
 
 
+@app.post("/sensorData/batch")
+async def receive_temp_batch(request: Request, device_id: str = DeviceQuery):
+    try:
+        shards = await read_shards(request, SensorData, sensor_row, sensor_rows, device_id, batch=True)
+    except ImportError:
+        return unsupported_body()
+    except (ValueError, TypeError, ValidationError) as e:
+        return batch_error(e)
+
+    count = sum(len(rows) for rows in shards.values())
+    logger.info("sensor_data batch readings=%d devices=%d", count, len(shards))
+
+    for device, rows in shards.items():
+        await store("sensor_data", rows, device)
+    return {"status": "success", "count": count}
+
 
 @app.post("/sleepEvent")
-async def receive_sleep_event(data: SleepEventData):
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    event = SleepEvent(data.sleepEvent)
-    print(f"[{now}] Sleep Event: {event.name} %")
-
-    file_path = f"{data_dir}/sleep_event_log.csv"
-    write_header = not os.path.exists(file_path)
-
-    with open(file_path, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        if write_header:
-            writer.writerow(["timestamp", "sleep_event"])
-        writer.writerow([now, event.name])
+async def receive_sleep_event(request: Request, device_id: str = DeviceQuery):
+    try:
+        shards = await read_shards(request, SleepEventData, sleep_event_row, sleep_event_rows, device_id, batch=False)
+    except ImportError:
+        return unsupported_body()
+    except (ValueError, TypeError, ValidationError) as e:
+        return reading_error(e)
+
+    for device, rows in shards.items():
+        logger.debug("sleep_event timestamp=%s device=%s event=%s", rows[0][0], device, rows[0][1])
+        await store("sleep_events", rows, device)
     return {"status": "success"}
 
+
+@app.post("/sleepEvent/batch")
+async def receive_sleep_event_batch(request: Request, device_id: str = DeviceQuery):
+    try:
+        shards = await read_shards(request, SleepEventData, sleep_event_row, sleep_event_rows, device_id, batch=True)
+    except ImportError:
+        return unsupported_body()
+    except (ValueError, TypeError, ValidationError) as e:
+        return batch_error(e)
+
+    count = sum(len(rows) for rows in shards.values())
+    logger.info("sleep_event batch events=%d devices=%d", count, len(shards))
+
+    for device, rows in shards.items():
+        await store("sleep_events", rows, device)
+    return {"status": "success", "count": count}
+
+@app.post("/rawSamples")
+async def receive_raw_samples(chunk: RawSampleChunk):
+    received = datetime.now()
+    detector = raw_detectors.get(chunk.device_id)
+    if detector is None:
+        detector = raw_detectors[chunk.device_id] = RawSampleDetector(detector_settings)
+    try:
+        events, first_millis, last_millis = detector.process(chunk.sample_rate, chunk.sound, chunk.light,
+                                                   chunk.movement, chunk.start_millis)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=422)
+
+    # Map device millis onto wall time, anchored on the first sample if the device sent
+    # its time, otherwise on the last sample arriving now
+    if chunk.timestamp is not None:
+        anchor = chunk.timestamp.timestamp() - first_millis / 1000.0
+    else:
+        anchor = received.timestamp() - last_millis / 1000.0
+    rows = [[format_timestamp(datetime.fromtimestamp(anchor + millis / 1000.0)), name] for name, millis in events]
+    logger.debug("raw_samples device=%s samples=%d events=%d", chunk.device_id,
+                 max(len(chunk.sound), len(chunk.light), len(chunk.movement)), len(rows))
+
+    if rows:
+        await store("sleep_events", rows, chunk.device_id)
+    return {"status": "success", "count": len(rows)}
+
+
+@app.get("/detectorSettings")
+async def get_detector_settings():
+    return detector_settings
+
+
+@app.post("/detectorSettings")
+async def update_detector_settings(settings: dict):
+    try:
+        settings = validate_detector_settings(settings)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=422)
+    detector_settings.update(settings)
+    for detector in raw_detectors.values():
+        detector.update_settings(settings)
+    return detector_settings
+
 @app.post("/groundTruth")
-async def receive_ground_truth():
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"Ground Truth Sleep time: {now}")
-
-    file_path = f"{data_dir}/ground_truth_log.csv"
-    write_header = not os.path.exists(file_path)
-
-    with open(file_path, mode="a", newline="") as file:
-        writer = csv.writer(file)
-        if write_header:
-            writer.writerow(["timestamp"])
-        writer.writerow([now])
+async def receive_ground_truth(device_id: str = DeviceQuery):
+    now = format_timestamp()
+    logger.info("ground_truth timestamp=%s device=%s", now, device_id)
+
+    await store("ground_truth", [[now]], device_id)
     return {"status": "success"}
 
+@app.get("/stream")
+async def stream():
+    # Live Server-Sent Events feed of every ingested reading, event and ground truth mark
+    subscriber = broadcaster.subscribe()
+    return StreamingResponse(broadcaster.stream(subscriber), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
-    print(date.today())
-    data_dir = f"{parent_data_dir}/{date.today()}"
-    if not os.path.exists(data_dir):
-        os.mkdir(data_dir)
+    night = str(date.today())
+    logger.info("logging night=%s to %s", night, parent_data_dir)
 
 
     uvicorn.run(app, host="0.0.0.0", port=6543)
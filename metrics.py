@@ -0,0 +1,184 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics in the Prometheus text format, shared by both servers.
+# Counters and histograms are created once per name (modules can be re-imported),
+# gauges are read from a callback when /metrics is scraped.
+
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = {}
+_lock = threading.Lock()
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+                    for key, value in sorted(self.values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip([*self.buckets, "+Inf"], counts):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else format_value(float(bound))
+                    labels = format_labels(self.labels, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {format_value(total)}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        return [f"{self.name} {format_value(self.read())}"]
+
+
+def register(cls, name, *args, **kwargs):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None or cls is Gauge:
+            metric = _metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+
+def counter(name, help, labels=()):
+    return register(Counter, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return register(Histogram, name, help, labels, buckets)
+
+
+def gauge(name, help, read):
+    return register(Gauge, name, help, read)
+
+
+def render():
+    lines = []
+    with _lock:
+        metrics = sorted(_metrics.values(), key=lambda metric: metric.name)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+REQUESTS = counter("sleep_http_requests_total", "HTTP requests by endpoint and status",
+                   ["server", "method", "path", "status"])
+REQUEST_SECONDS = histogram("sleep_http_request_seconds", "HTTP request latency by endpoint",
+                            ["server", "method", "path"])
+# Time spent in file I/O, CSV parsing/serializing and SQLite, by operation
+STORAGE_SECONDS = histogram("sleep_storage_seconds", "Storage time by operation", ["operation"])
+RESPONSE_BYTES = counter("sleep_http_response_bytes_total", "Response body bytes sent (as sent, after gzip)",
+                         ["server", "path"])
+
+
+def instrument(app, server):
+    # Per-endpoint request counts, latency and bytes served, plus the /metrics endpoint.
+    # Added last, so it sits outside gzip and sees the compressed response size.
+    from fastapi.responses import PlainTextResponse
+
+    @app.middleware("http")
+    async def record_request(request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - start, server=server, method=request.method, path=path)
+        REQUESTS.inc(server=server, method=request.method, path=path, status=response.status_code)
+        length = response.headers.get("content-length")
+        if length is not None:
+            RESPONSE_BYTES.inc(int(length), server=server, path=path)
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+
+def configure_logging(name):
+    # SLEEP_LOG_LEVEL=DEBUG|INFO|WARNING|ERROR, or OFF to silence the server entirely
+    level = os.environ.get("SLEEP_LOG_LEVEL", "INFO").upper()
+    logger = logging.getLogger(name)
+    if level == "OFF":
+        logger.disabled = True
+        return logger
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
@@ -0,0 +1,221 @@
+import argparse
+import csv
+import lzma
+import os
+import struct
+import zlib
+from datetime import date
+
+import numpy as np
+
+# Compact binary archive for finished nights. Each CSV log becomes <log>.arc:
+#
+#   header  "SLPA", version, codec (0 zlib, 1 lzma), log kind, row count, block count
+#   blocks  rows, first/last timestamp, compressed size, then the compressed payload
+#
+# A block payload holds up to BLOCK_ROWS rows column by column: delta-coded int64
+# epoch seconds, then float32 readings and int32 light/sound, or uint8 event codes.
+# Readers only decompress the blocks overlapping a requested time range.
+#
+# Archiving is lossless: every log is read back and compared with its CSV before
+# the CSV is removed (readings by value, so "68.00" may come back as "68.0"), and
+# logs that don't round trip (odd values, sub-second or unpadded timestamps) stay
+# as CSV. Rows appended to an archived night go to a fresh CSV,
+# which readers return after the archived rows.
+
+MAGIC = b"SLPA"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBxQI")
+BLOCK_HEADER = struct.Struct("<IqqI")
+BLOCK_ROWS = 65536
+CODECS = {"zlib": 0, "lzma": 1}
+
+# log file -> (kind, stored columns after the timestamp)
+LOGS = {
+    "sensor_data_log.csv": (0, [("temperature", np.float32), ("humidity", np.float32), ("heat_index", np.float32),
+                                ("light", np.int32), ("sound", np.int32)]),
+    "sleep_event_log.csv": (1, [("sleep_event", np.uint8)]),
+    "ground_truth_log.csv": (2, []),
+}
+LOG_NAMES = {kind: name for name, (kind, _) in LOGS.items()}
+# Same codes as the SleepEvent enum in main.py and the firmware
+EVENT_CODES = {"LIGHT": 0, "SOUND": 1, "MOVEMENT": 2}
+EVENT_NAMES = np.array(list(EVENT_CODES), dtype=object)
+
+
+def archive_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".arc"
+
+
+def to_epoch(timestamps):
+    return np.array([t.replace(" ", "T") for t in timestamps], dtype="datetime64[s]").astype(np.int64)
+
+
+def format_column(values):
+    # float32 converts to its shortest repr, so "66.09" comes back as "66.09".
+    # Readings repeat a lot, so only the distinct values are formatted.
+    if values.dtype == np.uint8:
+        return EVENT_NAMES[values].tolist()
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return distinct.astype(str).astype(object)[inverse].tolist()
+
+
+def read_blocks(path, low=None, high=None):
+    # (epoch seconds, {column: array}) for every block that overlaps [low, high]
+    with open(path, "rb") as f:
+        magic, version, codec, kind, _, block_count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a night archive: {path}")
+        _, columns = LOGS[LOG_NAMES[kind]]
+        for _ in range(block_count):
+            count, first, last, size = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            if (high is not None and first > high) or (low is not None and last < low):
+                f.seek(size, os.SEEK_CUR)
+                continue
+            data = f.read(size)
+            data = lzma.decompress(data) if codec == CODECS["lzma"] else zlib.decompress(data)
+            epoch = np.cumsum(np.frombuffer(data, dtype="<i8", count=count))
+            offset = count * 8
+            arrays = {}
+            for column, dtype in columns:
+                dtype = np.dtype(dtype).newbyteorder("<")
+                arrays[column] = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+                offset += count * dtype.itemsize
+            yield epoch, arrays
+
+
+def read_archive(path, start=None, end=None):
+    # Rows as string dicts like the CSV reader, optionally only start <= timestamp <= end
+    low = to_epoch([start])[0] if start is not None else None
+    high = to_epoch([end])[0] if end is not None else None
+    rows = []
+    for epoch, arrays in read_blocks(path, low, high):
+        keep = np.ones(len(epoch), dtype=bool)
+        if low is not None:
+            keep &= epoch >= low
+        if high is not None:
+            keep &= epoch <= high
+        timestamps = [t.replace("T", " ") for t in np.datetime_as_string(epoch[keep].astype("datetime64[s]")).tolist()]
+        columns = {column: format_column(array[keep]) for column, array in arrays.items()}
+        names = ["timestamp", *columns]
+        rows.extend(dict(zip(names, values)) for values in zip(timestamps, *columns.values()))
+    return rows
+
+
+def read_archive_arrays(path):
+    # Epoch seconds and the stored columns of a whole archive, for the analysis loader
+    blocks = list(read_blocks(path))
+    columns = LOGS[os.path.splitext(os.path.basename(path))[0] + ".csv"][1]
+    epoch = np.concatenate([block[0] for block in blocks]) if blocks else np.zeros(0, dtype=np.int64)
+    arrays = {column: np.concatenate([block[1][column] for block in blocks]) if blocks else np.zeros(0, dtype=dtype)
+              for column, dtype in columns}
+    return epoch, arrays
+
+
+def write_archive(path, name, rows, codec="zlib"):
+    kind, columns = LOGS[name]
+    epoch = to_epoch([row["timestamp"] for row in rows])
+    arrays = []
+    for column, dtype in columns:
+        values = [row[column] for row in rows]
+        if dtype == np.uint8:
+            arrays.append(np.array([EVENT_CODES[value] for value in values], dtype=np.uint8))
+        else:
+            arrays.append(np.array(values, dtype=np.float64).astype(dtype))
+
+    with open(path, "wb") as f:
+        blocks = range(0, len(rows), BLOCK_ROWS)
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS[codec], kind, len(rows), len(blocks)))
+        for start in blocks:
+            block_epoch = epoch[start:start + BLOCK_ROWS]
+            payload = b"".join([np.diff(block_epoch, prepend=0).astype("<i8").tobytes()] +
+                               [array[start:start + BLOCK_ROWS].astype(array.dtype.newbyteorder("<")).tobytes()
+                                for array in arrays])
+            payload = lzma.compress(payload) if codec == "lzma" else zlib.compress(payload, 9)
+            f.write(BLOCK_HEADER.pack(len(block_epoch), block_epoch.min(), block_epoch.max(), len(payload)))
+            f.write(payload)
+
+
+def same_rows(name, rows, archived):
+    _, columns = LOGS[name]
+    if len(rows) != len(archived):
+        return False
+    for row, back in zip(rows, archived):
+        if row["timestamp"] != back["timestamp"] or len(row) != len(back):
+            return False
+        for column, dtype in columns:
+            if dtype == np.uint8:
+                if row[column] != back[column]:
+                    return False
+            elif float(row[column]) != float(back[column]):
+                return False
+    return True
+
+
+def archive_log(csv_path, codec="zlib"):
+    # Fold a CSV log (and any earlier archive of it) into <log>.arc and remove the CSV.
+    # Returns the archived row count, or None if the log doesn't round trip.
+    name = os.path.basename(csv_path)
+    path = archive_path(csv_path)
+    with open(csv_path, "r", newline="") as f:
+        rows = list(csv.DictReader(f))
+    if os.path.exists(path):
+        rows = read_archive(path) + rows
+
+    tmp_path = path + ".tmp"
+    try:
+        write_archive(tmp_path, name, rows, codec)
+        exact = same_rows(name, rows, read_archive(tmp_path))
+    except (KeyError, ValueError, TypeError):
+        exact = False
+    if not exact:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    os.replace(tmp_path, path)
+    os.remove(csv_path)
+    if os.path.exists(csv_path + ".idx"):
+        os.remove(csv_path + ".idx")
+    return len(rows)
+
+
+def archive_nights(root, before, codec="zlib"):
+    # Archive every log of every night (and device) older than `before`
+    saved = 0
+    for night in sorted(os.listdir(root)):
+        night_dir = os.path.join(root, night)
+        if night >= before or not os.path.isdir(night_dir):
+            continue
+        devices_dir = os.path.join(night_dir, "devices")
+        dirs = [night_dir] + ([os.path.join(devices_dir, device) for device in sorted(os.listdir(devices_dir))]
+                              if os.path.isdir(devices_dir) else [])
+        for dir_path in dirs:
+            for name in LOGS:
+                csv_path = os.path.join(dir_path, name)
+                if not os.path.exists(csv_path):
+                    continue
+                size = os.path.getsize(csv_path)
+                before_size = size + (os.path.getsize(archive_path(csv_path))
+                                      if os.path.exists(archive_path(csv_path)) else 0)
+                count = archive_log(csv_path, codec)
+                relative = os.path.relpath(csv_path, root)
+                if count is None:
+                    print(f"Keeping {relative} as CSV, it doesn't round trip through the archive")
+                    continue
+                after_size = os.path.getsize(archive_path(csv_path))
+                saved += before_size - after_size
+                print(f"Archived {relative}: {count} rows, {before_size} -> {after_size} bytes")
+    return saved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact finished nights of a sleep_data tree into binary archives.")
+    parser.add_argument("root", nargs="?", default="sleep_data")
+    parser.add_argument("--before", default=str(date.today()),
+                        help="archive nights strictly before this date (default today, so the live night stays CSV)")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="zlib")
+    args = parser.parse_args()
+
+    saved = archive_nights(args.root, args.before, args.codec)
+    print(f"Saved {saved} bytes")
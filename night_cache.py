@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(rows):
+    # Rough in-memory footprint of a list of row dicts (the keys are shared strings)
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+    return size
+
+
+class NightCache:
+    # Bounded LRU of parsed log files keyed by (night, file). Each entry remembers
+    # the file's mtime and size when it was parsed, so past nights are served from
+    # memory while tonight's growing log is re-parsed as soon as it changes.
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, path, load):
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        rows = load(path)
+        size = estimate_size(rows)
+
+        with self.lock:
+            self.discard(key)
+            if size <= self.max_bytes:
+                self.entries[key] = (signature, rows, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    self.discard(next(iter(self.entries)))
+                    self.evictions += 1
+        return rows
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,152 @@
+import numpy as np
+
+from storage import TABLES
+
+# Per-minute, per-15-minute and per-night aggregates of a night's sensor readings
+# (count, min, max, sum, sum of squares per column) and sleep events (count per
+# type). The ingest writer keeps them up to date as rows are written and stores
+# them next to the logs; nights without stored rollups are backfilled from raw
+# rows. Buckets are keyed by their start time ("YYYY-MM-DD HH:MM:00"), or "night".
+
+ROLLUPS_VERSION = 1
+RESOLUTIONS = ["1m", "15m", "night"]
+ROLLUP_TABLES = ["sensor_data", "sleep_events"]
+SENSOR_COLUMNS = TABLES["sensor_data"][1][1:]
+EVENT_TYPES = ["LIGHT", "SOUND", "MOVEMENT"]
+STATS = ["count", "min", "max", "sum", "sumsq"]
+
+
+def bucket_key(timestamp, resolution):
+    if resolution == "1m":
+        return timestamp[:16] + ":00"
+    if resolution == "15m":
+        return f"{timestamp[:14]}{int(timestamp[14:16]) // 15 * 15:02d}:00"
+    return "night"
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class Rollups:
+
+    def __init__(self, buckets=None):
+        # resolution -> bucket -> {"sensor": {column: [count, min, max, sum, sumsq]}, "events": {type: count}}
+        self.buckets = buckets or {resolution: {} for resolution in RESOLUTIONS}
+
+    def bucket(self, resolution, key):
+        bucket = self.buckets[resolution].get(key)
+        if bucket is None:
+            bucket = self.buckets[resolution][key] = {"sensor": {}, "events": {}}
+        return bucket
+
+    def add(self, table, rows):
+        # rows as written to storage: lists in TABLES column order
+        rows = [row for row in rows if len(str(row[0])) == 19]
+        if not rows:
+            return
+        if table == "sensor_data":
+            self.add_sensor_rows(rows)
+        elif table == "sleep_events":
+            self.add_event_rows(rows)
+
+    def add_sensor_rows(self, rows):
+        timestamps = [str(row[0]) for row in rows]
+        values = np.array([[to_float(value) for value in row[1:]] for row in rows], dtype=float)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+
+        for resolution in RESOLUTIONS:
+            keys, inverse = np.unique([bucket_key(t, resolution) for t in timestamps], return_inverse=True)
+            shape = (len(keys), len(SENSOR_COLUMNS))
+            counts = np.zeros(shape, dtype=np.int64)
+            sums = np.zeros(shape)
+            squares = np.zeros(shape)
+            lows = np.full(shape, np.inf)
+            highs = np.full(shape, -np.inf)
+            np.add.at(counts, inverse, valid)
+            np.add.at(sums, inverse, filled)
+            np.add.at(squares, inverse, filled * filled)
+            np.minimum.at(lows, inverse, np.where(valid, values, np.inf))
+            np.maximum.at(highs, inverse, np.where(valid, values, -np.inf))
+
+            # Fold each touched bucket into the running totals
+            for i, key in enumerate(keys.tolist()):
+                sensor = self.bucket(resolution, key)["sensor"]
+                for j, column in enumerate(SENSOR_COLUMNS):
+                    if not counts[i, j]:
+                        continue
+                    stats = sensor.get(column)
+                    if stats is None:
+                        sensor[column] = [int(counts[i, j]), float(lows[i, j]), float(highs[i, j]),
+                                          float(sums[i, j]), float(squares[i, j])]
+                    else:
+                        stats[0] += int(counts[i, j])
+                        stats[1] = min(stats[1], float(lows[i, j]))
+                        stats[2] = max(stats[2], float(highs[i, j]))
+                        stats[3] += float(sums[i, j])
+                        stats[4] += float(squares[i, j])
+
+    def add_event_rows(self, rows):
+        for row in rows:
+            for resolution in RESOLUTIONS:
+                events = self.bucket(resolution, bucket_key(str(row[0]), resolution))["events"]
+                events[row[1]] = events.get(row[1], 0) + 1
+
+    def merge(self, other):
+        for resolution, buckets in other.buckets.items():
+            for key, bucket in buckets.items():
+                target = self.bucket(resolution, key)
+                for column, stats in bucket["sensor"].items():
+                    mine = target["sensor"].get(column)
+                    if mine is None:
+                        target["sensor"][column] = list(stats)
+                    else:
+                        target["sensor"][column] = [mine[0] + stats[0], min(mine[1], stats[1]), max(mine[2], stats[2]),
+                                                    mine[3] + stats[3], mine[4] + stats[4]]
+                for event, count in bucket["events"].items():
+                    target["events"][event] = target["events"].get(event, 0) + count
+        return self
+
+    def view(self, resolution, start=None, end=None):
+        # Buckets overlapping start..end in time order, with the mean of each column
+        output = []
+        first = bucket_key(start, resolution) if start is not None else None
+        for key in sorted(self.buckets[resolution]):
+            if resolution != "night" and ((first is not None and key < first) or (end is not None and key > end)):
+                continue
+            bucket = self.buckets[resolution][key]
+            entry = {"start": key}
+            for column in SENSOR_COLUMNS:
+                stats = bucket["sensor"].get(column)
+                if stats is not None:
+                    entry[column] = {**dict(zip(STATS, stats)), "mean": stats[3] / stats[0]}
+            entry["events"] = {event: bucket["events"].get(event, 0) for event in EVENT_TYPES}
+            output.append(entry)
+        return output
+
+    def to_json(self):
+        return {"version": ROLLUPS_VERSION, "buckets": self.buckets}
+
+    @classmethod
+    def from_json(cls, data):
+        if data is None or data.get("version") != ROLLUPS_VERSION:
+            return None
+        return cls(data["buckets"])
+
+    @classmethod
+    def from_logs(cls, logs):
+        # Backfill from raw rows: {table: row dicts or None}
+        rollups = cls()
+        for table, rows in logs.items():
+            if rows:
+                columns = TABLES[table][1]
+                rollups.add(table, [[row[column] for column in columns] for row in rows])
+        return rollups
+
+
+def read_logs(storage, night, device):
+    return {table: storage.read(table, night, device=device) for table in ROLLUP_TABLES}
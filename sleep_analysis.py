@@ -0,0 +1,176 @@
+import argparse
+import importlib
+import os
+import sys
+import time
+
+# Single entry point for the scripts in data_analysis_scripts:
+#   python -m sleep_analysis run all --jobs 8
+#   python -m sleep_analysis run sensor_corr wake_time_diff
+# Nights are parsed in a process pool into the shared dataset snapshot, per-night
+# results are computed for new or changed nights only, then each analysis runs its
+# cross-night step (correlations, plots) on the merged data. Figures go through
+# data_analysis_scripts/render_pipeline.py, which only redraws the ones whose data changed.
+#
+# Journal queries only need journal_index.py and skip pandas, matplotlib and scipy:
+#   python -m sleep_analysis latency              (the latest night with a journal)
+#   python -m sleep_analysis quality 2025-05-20 2025-05-21
+#   python -m sleep_analysis keywords
+#   python -m sleep_analysis search melatonin
+#
+# Per-epoch features for every night (data_analysis_scripts/epoch_features.py):
+#   python -m sleep_analysis epochs --epoch 30 --window 10 --output .cache/epoch_features.npz
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_analysis_scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+ANALYSES = [
+    "dataset_analysis",
+    "device_data_analysis",
+    "events_during_true_sleep",
+    "sensor_corr",
+    "sleep_event_disruption_corr",
+    "sleep_time_analysis",
+    "wake_time_diff",
+]
+
+
+def timed(timings, stage, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings.append((stage, time.perf_counter() - start))
+    return result
+
+
+def print_timings(timings):
+    print("\nStage timings:")
+    width = max(len(stage) for stage, _ in timings)
+    for stage, seconds in timings:
+        print(f"  {stage:<{width}}  {seconds:8.3f} s")
+    print(f"  {'total':<{width}}  {sum(seconds for _, seconds in timings):8.3f} s")
+
+
+def run(names, top_dir, jobs):
+    if "all" in names:
+        names = ANALYSES
+    unknown = [name for name in names if name not in ANALYSES]
+    if unknown:
+        raise SystemExit(f"Unknown analysis: {', '.join(unknown)} (choose from {', '.join(ANALYSES)})")
+
+    timings = []
+    dataset_loader = timed(timings, "import", importlib.import_module, "dataset_loader")
+    timed(timings, "load nights", dataset_loader.load_dataset, top_dir, jobs=jobs)
+    night_results = timed(timings, "night results (import)", importlib.import_module, "night_results")
+    timed(timings, "night results", night_results.load_night_results, top_dir, jobs=jobs)
+
+    for name in names:
+        print(f"\n=== {name}")
+        module = timed(timings, f"{name} (import)", importlib.import_module, name)
+        timed(timings, name, module.main, top_dir, jobs=jobs)
+
+    print_timings(timings)
+
+
+def build_epochs(top_dir, jobs, epoch_seconds, window_epochs, output):
+    timings = []
+    dataset_loader = timed(timings, "import", importlib.import_module, "dataset_loader")
+    dataset = timed(timings, "load nights", dataset_loader.load_dataset, top_dir, jobs=jobs)
+    epoch_features = timed(timings, "epoch features (import)", importlib.import_module, "epoch_features")
+    features = timed(timings, "epoch features", epoch_features.build_epoch_features, dataset, epoch_seconds,
+                     window_epochs)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    timed(timings, "save", features.save, output)
+
+    rows, columns = features.matrix.shape
+    print(f"{rows} epochs of {epoch_seconds} s x {columns} features over {len(features.night_names)} nights -> {output}")
+    print_timings(timings)
+
+
+def open_journals(top_dir):
+    sys.path.insert(0, REPO_ROOT)
+    from journal_index import JournalIndex
+    return JournalIndex(top_dir, path=os.path.join(".cache", "journal_index.json"))
+
+
+def show_field(field, nights, last, top_dir):
+    journals = open_journals(top_dir)
+    summaries = journals.summaries()
+    if nights:
+        found = {summary["night"]: summary for summary in summaries}
+        selected = [found.get(night, {"night": night, field: None}) for night in nights]
+    else:
+        selected = [summary for summary in summaries if summary[field] is not None][-last:]
+    if not selected:
+        print(f"No journal has a {field}.")
+    for summary in selected:
+        value = summary[field]
+        print(f"{summary['night']}: {value if value is not None else 'no ' + field + ' in journal'}")
+
+
+def show_keywords(top_dir):
+    from journal_index import KEYWORDS
+
+    summaries = open_journals(top_dir).summaries()
+    for keyword in KEYWORDS:
+        mentioned = sum(summary[keyword] for summary in summaries)
+        print(f"{keyword}: {mentioned} of {len(summaries)} nights")
+
+
+def search(terms, top_dir):
+    nights = open_journals(top_dir).search(" ".join(terms))
+    print("\n".join(nights) if nights else "No journal mentions " + " ".join(terms))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sleep_analysis", description="Run the sleep data analyses.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run one or more analyses")
+    run_parser.add_argument("analyses", nargs="+", help=f"'all' or any of: {', '.join(ANALYSES)}")
+    run_parser.add_argument("--data", default="sleep_data", help="sleep_data directory (default: sleep_data)")
+    run_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                            help="processes used to parse nights and draw figures (default: all cores)")
+
+    subparsers.add_parser("list", help="list the available analyses")
+
+    epochs_parser = subparsers.add_parser("epochs", help="build the per-epoch feature matrix for every night")
+    epochs_parser.add_argument("--epoch", type=int, default=30, help="epoch length in seconds (default: 30)")
+    epochs_parser.add_argument("--window", type=int, default=10,
+                               help="epochs in the trailing window for rolling means and slopes (default: 10)")
+    epochs_parser.add_argument("--output", default=os.path.join(".cache", "epoch_features.npz"))
+    epochs_parser.add_argument("--data", default="sleep_data", help="sleep_data directory (default: sleep_data)")
+    epochs_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                               help="processes used to parse nights (default: all cores)")
+
+    for field in ("latency", "quality", "duration"):
+        field_parser = subparsers.add_parser(field, help=f"sleep {field} from the journals")
+        field_parser.add_argument("nights", nargs="*", help="nights to show (default: the latest with a journal)")
+        field_parser.add_argument("--last", type=int, default=1, help="show the last N nights instead")
+        field_parser.add_argument("--data", default="sleep_data")
+    keywords_parser = subparsers.add_parser("keywords", help="nights mentioning each supplement keyword")
+    keywords_parser.add_argument("--data", default="sleep_data")
+    search_parser = subparsers.add_parser("search", help="nights whose journal mentions every term")
+    search_parser.add_argument("terms", nargs="+")
+    search_parser.add_argument("--data", default="sleep_data")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        print("\n".join(ANALYSES))
+    elif args.command == "run":
+        run(args.analyses, args.data, max(1, args.jobs))
+    elif args.command == "epochs":
+        if args.epoch < 1 or args.window < 1:
+            parser.error("--epoch and --window must be at least 1")
+        build_epochs(args.data, max(1, args.jobs), args.epoch, args.window, args.output)
+    elif args.command == "keywords":
+        show_keywords(args.data)
+    elif args.command == "search":
+        search(args.terms, args.data)
+    else:
+        show_field(args.command, args.nights, max(1, args.last), args.data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import argparse
+import csv
+import heapq
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from metrics import STORAGE_SECONDS
+from night_archive import archive_path, read_archive
+from timestamp_index import IndexWriter, read_range
+
+# table name -> (per-night CSV file, columns)
+TABLES = {
+    "sensor_data": ("sensor_data_log.csv", ["timestamp", "temperature", "humidity", "heat_index", "light", "sound"]),
+    "sleep_events": ("sleep_event_log.csv", ["timestamp", "sleep_event"]),
+    "ground_truth": ("ground_truth_log.csv", ["timestamp"]),
+}
+
+# Readings without a device_id belong to the default device, which keeps the original
+# sleep_data/<night>/ layout; other devices get sleep_data/<night>/devices/<id>/
+DEFAULT_DEVICE = "default"
+DEVICE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def valid_device_id(device):
+    return DEVICE_ID_PATTERN.fullmatch(device) is not None
+
+
+class Storage:
+    # Common interface for the ingest server (append/flush/close) and the
+    # charting server (read/available_nights/read_journal).
+    # Timestamps are "YYYY-MM-DD HH:MM:SS" strings, so range bounds compare as text.
+    # Every log is partitioned by night and device; appends to different devices
+    # never share a file.
+
+    def __init__(self, root):
+        self.root = root
+
+    def append(self, table, night, rows, device=DEFAULT_DEVICE):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def read(self, table, night, start=None, end=None, device=DEFAULT_DEVICE):
+        # Returns a list of row dicts, or None if the night has no such log
+        raise NotImplementedError
+
+    def devices(self, night):
+        raise NotImplementedError
+
+    def write_rollups(self, night, device, rollups):
+        # Stored with the next flush, so they never describe rows that aren't on disk
+        raise NotImplementedError
+
+    def read_rollups(self, night, device=DEFAULT_DEVICE):
+        # The stored rollups (rollups.py) as a JSON dict, or None if there are none
+        # or they are older than the logs they summarize
+        raise NotImplementedError
+
+    def read_devices(self, table, night, devices, start=None, end=None):
+        # Several devices merged by timestamp, each row tagged with its device.
+        # None if none of them has the log.
+        logs = []
+        for device in devices:
+            rows = self.read(table, night, start, end, device)
+            if rows is not None:
+                logs.append([{**row, "device": device} for row in rows])
+        if not logs:
+            return None
+        return list(heapq.merge(*logs, key=lambda row: row["timestamp"]))
+
+    def available_nights(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name))]
+
+    def read_journal(self, night):
+        # Journals are written by hand, so they stay as text files for every backend
+        file_path = os.path.join(self.root, night, "journal.txt")
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, mode="r") as file:
+            return file.read()
+
+
+def read_csv_rows(file_path):
+    with STORAGE_SECONDS.time(operation="file_read"):
+        with open(file_path, mode="r", newline="") as file:
+            text = file.read()
+    with STORAGE_SECONDS.time(operation="csv_parse"):
+        return [row for row in csv.DictReader(io.StringIO(text))]
+
+
+def read_archive_rows(file_path):
+    with STORAGE_SECONDS.time(operation="archive_read"):
+        return read_archive(file_path)
+
+
+class CsvStorage(Storage):
+    # The original layout: sleep_data/<night>/<log>.csv, one file per table and night.
+    # Readers may pass a NightCache so repeated reads skip re-parsing unchanged files.
+    # Each log gets a sparse timestamp index (timestamp_index.py) so time-range reads
+    # only parse the part of the file they need. Finished nights may have been
+    # compacted by night_archive.py; their <log>.arc is read first, then any CSV
+    # rows appended since.
+
+    def __init__(self, root, cache=None):
+        super().__init__(root)
+        self.files = {}
+        self.indexes = {}
+        self.rollups = {}
+        self.cache = cache
+
+    def directory(self, night, device=DEFAULT_DEVICE):
+        if device == DEFAULT_DEVICE:
+            return os.path.join(self.root, night)
+        return os.path.join(self.root, night, "devices", device)
+
+    def path(self, table, night, device=DEFAULT_DEVICE):
+        return os.path.join(self.directory(night, device), TABLES[table][0])
+
+    def append(self, table, night, rows, device=DEFAULT_DEVICE):
+        shard = (table, night, device)
+        file = self.files.get(shard)
+        if file is None:
+            os.makedirs(self.directory(night, device), exist_ok=True)
+            file = open(self.path(table, night, device), mode="a", newline="")
+            if os.fstat(file.fileno()).st_size == 0:
+                csv.writer(file).writerow(TABLES[table][1])
+                file.flush()
+            self.files[shard] = file
+            self.indexes[shard] = IndexWriter(self.path(table, night, device))
+
+        # Serialize first so the index knows each row's length in bytes
+        with STORAGE_SECONDS.time(operation="csv_serialize"):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            lengths = [writer.writerow(row) for row in rows]
+            text = buffer.getvalue()
+            if not text.isascii():
+                lengths = [len(line.encode(file.encoding)) for line in text.splitlines(keepends=True)]
+        with STORAGE_SECONDS.time(operation="file_write"):
+            file.write(text)
+        self.indexes[shard].add(rows, lengths)
+
+    def flush(self):
+        with STORAGE_SECONDS.time(operation="file_flush"):
+            for file in self.files.values():
+                file.flush()
+            for index in self.indexes.values():
+                index.flush()
+        # Written after the logs so rollups.json is never older than the rows it covers
+        for (night, device), text in list(self.rollups.items()):
+            file_path = os.path.join(self.directory(night, device), "rollups.json")
+            with STORAGE_SECONDS.time(operation="rollups_write"):
+                with open(file_path + ".tmp", "w") as file:
+                    file.write(text)
+                os.replace(file_path + ".tmp", file_path)
+            del self.rollups[(night, device)]
+
+    def close(self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+        self.indexes = {}
+
+    def write_rollups(self, night, device, rollups):
+        self.rollups[(night, device)] = json.dumps(rollups)
+
+    def read_rollups(self, night, device=DEFAULT_DEVICE):
+        file_path = os.path.join(self.directory(night, device), "rollups.json")
+        try:
+            written = os.stat(file_path).st_mtime_ns
+        except OSError:
+            return None
+        for table in ("sensor_data", "sleep_events"):
+            log_path = self.path(table, night, device)
+            for path in (log_path, archive_path(log_path)):
+                if os.path.exists(path) and os.stat(path).st_mtime_ns > written:
+                    return None
+        with open(file_path, "r") as file:
+            return json.load(file)
+
+    def read(self, table, night, start=None, end=None, device=DEFAULT_DEVICE):
+        file_path = self.path(table, night, device)
+        archived = archive_path(file_path)
+        has_csv, has_archive = os.path.exists(file_path), os.path.exists(archived)
+        if not has_csv and not has_archive:
+            return None
+
+        rows = []
+        if has_archive:
+            if start is not None or end is not None:
+                with STORAGE_SECONDS.time(operation="archive_read"):
+                    rows = read_archive(archived, start, end)
+            else:
+                rows = self.read_file((night, device, os.path.basename(archived)), archived, read_archive_rows)
+        if has_csv:
+            if start is not None or end is not None:
+                csv_rows = read_range(file_path, start, end)
+            else:
+                csv_rows = self.read_file((night, device, TABLES[table][0]), file_path, read_csv_rows)
+            rows = rows + csv_rows if rows else csv_rows
+        return rows
+
+    def read_file(self, key, file_path, load):
+        if self.cache is not None:
+            return self.cache.get(key, file_path, load)
+        return load(file_path)
+
+    def has_log(self, table, night, device=DEFAULT_DEVICE):
+        file_path = self.path(table, night, device)
+        return os.path.exists(file_path) or os.path.exists(archive_path(file_path))
+
+    def devices(self, night):
+        devices = []
+        if any(self.has_log(table, night) for table in TABLES):
+            devices.append(DEFAULT_DEVICE)
+        devices_dir = os.path.join(self.root, night, "devices")
+        if os.path.isdir(devices_dir):
+            devices.extend(sorted(name for name in os.listdir(devices_dir)
+                                  if valid_device_id(name) and os.path.isdir(os.path.join(devices_dir, name))))
+        return devices
+
+
+class SqliteStorage(Storage):
+    # One database for every night. WAL mode lets the charting server read while
+    # the ingest server writes, and the (night, device_id, timestamp) indexes turn
+    # night and time-window reads into index range scans.
+
+    COLUMN_TYPES = {
+        "timestamp": "TEXT NOT NULL",
+        "temperature": "REAL",
+        "humidity": "REAL",
+        "heat_index": "REAL",
+        "light": "INTEGER",
+        "sound": "INTEGER",
+        "sleep_event": "TEXT",
+    }
+
+    def __init__(self, db_path, root):
+        super().__init__(root)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        for table, (_, columns) in TABLES.items():
+            definitions = ", ".join(f"{column} {self.COLUMN_TYPES[column]}" for column in columns)
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} (night TEXT NOT NULL, "
+                                    f"device_id TEXT NOT NULL DEFAULT '{DEFAULT_DEVICE}', {definitions})")
+            # Databases from before multi-device support get the column added in place
+            existing = [row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")]
+            if "device_id" not in existing:
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN device_id TEXT NOT NULL DEFAULT '{DEFAULT_DEVICE}'")
+            self.connection.execute(f"DROP INDEX IF EXISTS {table}_night_time")
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_night_device_time "
+                                    f"ON {table} (night, device_id, timestamp)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS rollups (night TEXT NOT NULL, device_id TEXT NOT NULL, "
+                                "data TEXT NOT NULL, PRIMARY KEY (night, device_id))")
+        self.connection.commit()
+
+    def append(self, table, night, rows, device=DEFAULT_DEVICE):
+        columns = TABLES[table][1]
+        placeholders = ", ".join("?" * (len(columns) + 2))
+        with self.lock, STORAGE_SECONDS.time(operation="sqlite_write"):
+            self.connection.executemany(
+                f"INSERT INTO {table} (night, device_id, {', '.join(columns)}) VALUES ({placeholders})",
+                [[night, device, *row] for row in rows],
+            )
+
+    def flush(self):
+        with self.lock, STORAGE_SECONDS.time(operation="sqlite_commit"):
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def read(self, table, night, start=None, end=None, device=DEFAULT_DEVICE):
+        columns = TABLES[table][1]
+        query = f"SELECT {', '.join(columns)} FROM {table} WHERE night = ? AND device_id = ?"
+        params = [night, device]
+        if start is not None:
+            query += " AND timestamp >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND timestamp <= ?"
+            params.append(end)
+        query += " ORDER BY timestamp, rowid"
+
+        with self.lock, STORAGE_SECONDS.time(operation="sqlite_read"):
+            rows = self.connection.execute(query, params).fetchall()
+            if not rows and not self.has_night(table, night, device):
+                return None
+        return [dict(row) for row in rows]
+
+    def has_night(self, table, night, device=DEFAULT_DEVICE):
+        return self.connection.execute(f"SELECT 1 FROM {table} WHERE night = ? AND device_id = ? LIMIT 1",
+                                       [night, device]).fetchone() is not None
+
+    def write_rollups(self, night, device, rollups):
+        # Same transaction as the rows they cover
+        with self.lock, STORAGE_SECONDS.time(operation="sqlite_write"):
+            self.connection.execute("INSERT OR REPLACE INTO rollups (night, device_id, data) VALUES (?, ?, ?)",
+                                    [night, device, json.dumps(rollups)])
+
+    def read_rollups(self, night, device=DEFAULT_DEVICE):
+        with self.lock, STORAGE_SECONDS.time(operation="sqlite_read"):
+            row = self.connection.execute("SELECT data FROM rollups WHERE night = ? AND device_id = ?",
+                                          [night, device]).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def devices(self, night):
+        with self.lock:
+            devices = {row[0] for table in TABLES
+                       for row in self.connection.execute(f"SELECT DISTINCT device_id FROM {table} WHERE night = ?", [night])}
+        return sorted(devices, key=lambda device: (device != DEFAULT_DEVICE, device))
+
+    def available_nights(self):
+        with self.lock:
+            nights = {row[0] for table in TABLES for row in self.connection.execute(f"SELECT DISTINCT night FROM {table}")}
+        return sorted(nights | set(super().available_nights()))
+
+    def import_csv(self, csv_storage):
+        # One-shot import of an existing sleep_data tree; re-importing a night replaces it
+        imported = 0
+        for night in sorted(csv_storage.available_nights()):
+            for device in csv_storage.devices(night):
+                for table, (_, columns) in TABLES.items():
+                    rows = csv_storage.read(table, night, device=device)
+                    if rows is None:
+                        continue
+                    with self.lock:
+                        self.connection.execute(f"DELETE FROM {table} WHERE night = ? AND device_id = ?", [night, device])
+                        # Rebuilt from the imported rows when next read
+                        self.connection.execute("DELETE FROM rollups WHERE night = ? AND device_id = ?", [night, device])
+                    self.append(table, night, [[row[column] for column in columns] for row in rows], device)
+                    imported += len(rows)
+            self.flush()
+        return imported
+
+
+def open_storage(root, backend=None, cache=None):
+    # SLEEP_STORAGE=csv (default) or sqlite; SLEEP_DB overrides the database path.
+    # The parsed-file cache only applies to the CSV backend.
+    backend = backend or os.environ.get("SLEEP_STORAGE", "csv")
+    if backend == "csv":
+        return CsvStorage(root, cache=cache)
+    if backend == "sqlite":
+        return SqliteStorage(os.environ.get("SLEEP_DB", os.path.join(root, "sleep_data.db")), root)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a sleep_data CSV tree into a SQLite database.")
+    parser.add_argument("root", nargs="?", default="sleep_data")
+    parser.add_argument("--db", default=None, help="defaults to <root>/sleep_data.db")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(args.root, "sleep_data.db")
+    database = SqliteStorage(db_path, args.root)
+    count = database.import_csv(CsvStorage(args.root))
+    database.close()
+    print(f"Imported {count} rows into {db_path}")
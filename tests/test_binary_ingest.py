@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from binary_ingest import EVENT_RECORD, SENSOR_RECORD, sensor_rows, sleep_event_rows
+
+
+def sensor_body(*epochs):
+    records = np.zeros(len(epochs), dtype=SENSOR_RECORD)
+    records["timestamp"] = epochs
+    records["temperature"] = 66.5
+    return records.tobytes()
+
+
+def event_body(*epochs):
+    records = np.zeros(len(epochs), dtype=EVENT_RECORD)
+    records["timestamp"] = epochs
+    return records.tobytes()
+
+
+@pytest.mark.parametrize("epoch", [2 ** 62, -(2 ** 62), -1, 253402300800])
+def test_out_of_range_epochs_are_value_errors(epoch):
+    with pytest.raises(ValueError, match="out of range"):
+        sensor_rows(sensor_body(1747000000, epoch))
+    with pytest.raises(ValueError, match="out of range"):
+        sleep_event_rows(event_body(epoch))
+
+
+def test_epoch_zero_is_now():
+    rows = sleep_event_rows(event_body(0))
+    assert rows[0][1] == "LIGHT" and rows[0][0].startswith("2")
+
+
+def test_out_of_range_struct_body_is_a_422(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    stored = []
+
+    async def store(table, rows, device="default"):
+        stored.append(rows)
+
+    monkeypatch.setattr(main, "store", store)
+    response = TestClient(main.app).post("/sensorData/batch", content=sensor_body(2 ** 62),
+                                         headers={"Content-Type": "application/x-sleep-sensor"})
+    assert response.status_code == 422
+    assert "out of range" in response.json()["error"]
+    assert stored == []
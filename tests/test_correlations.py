@@ -0,0 +1,33 @@
+import os
+import shutil
+
+import pytest
+
+from correlations import NightData, correlate
+from journal_index import JournalIndex
+from storage import CsvStorage, SqliteStorage
+
+SLEEP_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sleep_data")
+
+
+def test_csv_and_sqlite_backends_agree(tmp_path):
+    root = str(tmp_path / "sleep_data")
+    shutil.copytree(SLEEP_DATA, root)
+    csv_storage = CsvStorage(root)
+    sqlite_storage = SqliteStorage(str(tmp_path / "sleep_data.db"), root)
+    sqlite_storage.import_csv(csv_storage)
+    nights = sorted(csv_storage.available_nights())
+    journals = JournalIndex(root)
+
+    windows = ["onset", "night", "30m"]
+    from_csv = correlate(NightData(csv_storage, journals, nights), windows)
+    from_sqlite = correlate(NightData(sqlite_storage, journals, nights), windows)
+    sqlite_storage.close()
+
+    assert [(row["feature"], row["target"], row["n"], row["nights"]) for row in from_sqlite] == \
+        [(row["feature"], row["target"], row["n"], row["nights"]) for row in from_csv]
+    for csv_row, sqlite_row in zip(from_csv, from_sqlite):
+        assert sqlite_row["r"] == pytest.approx(csv_row["r"])
+    # The dark-room readings (light = 0) count on both backends
+    light = next(row for row in from_sqlite if row["feature"] == "onset_light" and row["target"] == "latency")
+    assert light["n"] > 1 and light["r"] is not None
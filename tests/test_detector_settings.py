@@ -0,0 +1,28 @@
+from fastapi.testclient import TestClient
+
+import main
+from event_detection import DEFAULT_SETTINGS, RawSampleDetector
+
+
+def test_bad_detector_settings_are_rejected(monkeypatch):
+    monkeypatch.setattr(main, "detector_settings", dict(DEFAULT_SETTINGS))
+    monkeypatch.setattr(main, "raw_detectors", {"bedroom": RawSampleDetector()})
+    client = TestClient(main.app)
+
+    for settings in ({"sound_margin": "abc"}, {"sound_margin": -1}, {"light_window": 0}, {"movement_window": 2.5},
+                     {"debounce_ms": None}, {"volume": 3}):
+        response = client.post("/detectorSettings", json=settings)
+        assert response.status_code == 422, settings
+        assert "error" in response.json()
+    assert main.detector_settings == DEFAULT_SETTINGS
+    assert main.raw_detectors["bedroom"].settings == DEFAULT_SETTINGS
+
+    response = client.post("/detectorSettings", json={"sound_margin": 250, "debounce_ms": 1500.5})
+    assert response.status_code == 200
+    assert response.json()["sound_margin"] == 250
+    assert main.raw_detectors["bedroom"].settings["debounce_ms"] == 1500.5
+
+    response = client.post("/detectorSettings", json={"light_window": 20})
+    assert response.status_code == 200
+    assert client.get("/detectorSettings").json()["light_window"] == 20
+    assert main.raw_detectors["bedroom"].detectors["LIGHT"].rolling.window == 20
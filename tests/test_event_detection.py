@@ -0,0 +1,39 @@
+from event_detection import RawSampleDetector
+
+
+def test_constant_input_has_no_events():
+    detector = RawSampleDetector()
+    for _ in range(3):
+        events, _, _ = detector.process(100, sound=[500] * 500, light=[100] * 500, movement=[900] * 500)
+        assert events == []
+
+
+def test_light_change_after_a_fresh_start():
+    detector = RawSampleDetector()
+    assert detector.process(100, light=[100] * 300)[0] == []
+    events, _, _ = detector.process(100, light=[100] * 100 + [300] * 200)
+    assert [name for name, _ in events] == ["LIGHT"]
+
+
+def test_chunks_match_one_long_stream():
+    light = [100] * 300 + [300] * 300 + [20] * 400
+    whole = RawSampleDetector().process(100, light=light)[0]
+    chunked = RawSampleDetector()
+    events = []
+    for start in range(0, len(light), 128):
+        events += chunked.process(100, light=light[start:start + 128])[0]
+    assert events == whole and whole
+
+
+def test_window_changes_apply_to_a_running_detector():
+    detector = RawSampleDetector()
+    assert detector.process(100, sound=[1000] * 90 + [0] * 10)[0] == []
+    # The last 10 samples are quiet; the default 100 sample average (900) would hide this spike
+    detector.update_settings({"sound_window": 10})
+    assert detector.detectors["SOUND"].rolling.window == 10
+    assert [name for name, _ in detector.process(100, sound=[400])[0]] == ["SOUND"]
+
+    # A longer window waits until it has enough history again
+    detector.update_settings({"sound_window": 50, "debounce_ms": 0})
+    assert detector.process(100, sound=[0] * 39 + [400])[0] == []
+    assert [name for name, _ in detector.process(100, sound=[400])[0]] == ["SOUND"]
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+import pytest
+
+from log_writer import LogWriter
+
+
+class FlakyStorage:
+    # Fails the first append, then stores everything
+    def __init__(self):
+        self.rows = []
+        self.failures = 1
+        self.closed = False
+
+    def read(self, table, night, start=None, end=None, device="default"):
+        return None
+
+    def append(self, table, night, rows, device="default"):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("No space left on device")
+        self.rows.extend(rows)
+
+    def write_rollups(self, night, device, rollups):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_writer_survives_a_failed_append(caplog):
+    storage = FlakyStorage()
+
+    async def scenario():
+        writer = LogWriter(max_rows=1)
+        writer.start(storage, "2025-05-20")
+        await writer.put("sleep_events", [["2025-05-20 23:00:00", "SOUND"]])
+        await asyncio.sleep(0.1)
+        await writer.put("sleep_events", [["2025-05-20 23:00:05", "LIGHT"]])
+        await writer.close()
+
+    with caplog.at_level(logging.ERROR, logger="sleep_sensor.ingest.writer"):
+        asyncio.run(scenario())
+    assert storage.rows == [["2025-05-20 23:00:05", "LIGHT"]]
+    assert storage.closed
+    assert "Failed to write 1 rows for device default" in caplog.text
+
+
+def test_put_fails_fast_once_the_writer_has_died(caplog):
+    storage = FlakyStorage()
+
+    async def scenario():
+        writer = LogWriter()
+        writer.start(storage, "2025-05-20")
+        writer.queue.put_nowait("not a batch")
+        await asyncio.sleep(0.1)
+        with pytest.raises(RuntimeError):
+            await writer.put("sleep_events", [["2025-05-20 23:00:00", "SOUND"]])
+        await writer.close()
+
+    with caplog.at_level(logging.ERROR, logger="sleep_sensor.ingest.writer"):
+        asyncio.run(scenario())
+    assert storage.closed
+    assert "Log writer stopped" in caplog.text
@@ -0,0 +1,165 @@
+import csv
+import io
+import os
+
+from metrics import STORAGE_SECONDS
+
+# Sparse sidecar index for the per-night CSV logs. <log>.idx has one line per block
+# of BLOCK_ROWS rows: "start offset,end offset,first timestamp,last timestamp" where
+# the timestamps are the smallest and largest in the block (batched uploads can
+# arrive out of order). A range read only seeks to and parses the blocks that
+# overlap the range, plus the few rows after the last complete block.
+#
+# The ingest writer appends entries as it flushes. Readers extend the index
+# themselves for logs written before it existed; if both add the same block the
+# duplicate line is skipped on load.
+
+BLOCK_ROWS = 64
+
+# log path -> (index file size, entries), so unchanged indexes aren't re-parsed
+_loaded = {}
+
+
+def index_path(log_path):
+    return log_path + ".idx"
+
+
+def format_entry(entry):
+    return f"{entry[0]},{entry[1]},{entry[2]},{entry[3]}\n"
+
+
+def load_entries(log_path):
+    path = index_path(log_path)
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return []
+    cached = _loaded.get(log_path)
+    if cached is not None and cached[0] == size:
+        return cached[1]
+
+    entries = []
+    with open(path, "r") as file:
+        for line in file:
+            parts = line.rstrip("\n").split(",")
+            if len(parts) != 4 or not line.endswith("\n"):
+                break
+            start, end = int(parts[0]), int(parts[1])
+            if entries and start < entries[-1][1]:
+                continue
+            if entries and start != entries[-1][1]:
+                break
+            entries.append((start, end, parts[2], parts[3]))
+    _loaded[log_path] = (size, entries)
+    return entries
+
+
+class Block:
+    # The block currently being filled, in rows and bytes
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.rows = 0
+        self.first = None
+        self.last = None
+
+    def add(self, timestamp, length):
+        self.end += length
+        self.rows += 1
+        self.first = timestamp if self.first is None or timestamp < self.first else self.first
+        self.last = timestamp if self.last is None or timestamp > self.last else self.last
+
+    def entry(self):
+        return (self.start, self.end, self.first, self.last)
+
+
+def scan(file, start):
+    # Index complete rows from byte offset start to the end of the file. Returns the
+    # complete blocks and the partly filled one that follows them.
+    file.seek(start)
+    entries = []
+    block = Block(start)
+    for line in file.read().splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        block.add(line.split(b",", 1)[0].decode(), len(line))
+        if block.rows == BLOCK_ROWS:
+            entries.append(block.entry())
+            block = Block(block.end)
+    return entries, block
+
+
+def update_index(log_path, file):
+    # Bring the index up to date with what's on disk; returns the entries and the
+    # unindexed tail block. file is the log opened in binary mode.
+    entries = load_entries(log_path)
+    if entries:
+        start = entries[-1][1]
+    else:
+        file.seek(0)
+        start = len(file.readline())
+    new_entries, tail = scan(file, start)
+    if new_entries:
+        with open(index_path(log_path), "a") as index_file:
+            index_file.write("".join(format_entry(entry) for entry in new_entries))
+        entries = entries + new_entries
+        _loaded[log_path] = (os.path.getsize(index_path(log_path)), entries)
+    return entries, tail
+
+
+def read_range(log_path, start=None, end=None):
+    # Rows (as string dicts, in file order) with start <= timestamp <= end
+    if not os.path.exists(log_path):
+        return None
+    with open(log_path, "rb") as file:
+        columns = next(csv.reader([file.readline().decode()]), None)
+        if columns is None:
+            return []
+        entries, tail = update_index(log_path, file)
+
+        spans = []
+        for block_start, block_end, first, last in entries:
+            if (end is None or first <= end) and (start is None or last >= start):
+                if spans and spans[-1][1] == block_start:
+                    spans[-1][1] = block_end
+                else:
+                    spans.append([block_start, block_end])
+        if tail.rows:
+            spans.append([tail.start, tail.end])
+
+        rows = []
+        for span_start, span_end in spans:
+            with STORAGE_SECONDS.time(operation="file_read"):
+                file.seek(span_start)
+                data = file.read(span_end - span_start).decode()
+            with STORAGE_SECONDS.time(operation="csv_parse"):
+                for row in csv.reader(io.StringIO(data)):
+                    if row and (start is None or row[0] >= start) and (end is None or row[0] <= end):
+                        rows.append(dict(zip(columns, row)))
+        return rows
+
+
+class IndexWriter:
+    # Tracks the rows CsvStorage appends to one log. Entries for completed blocks are
+    # written out in flush(), after the log itself has been flushed, so the index
+    # never points past the end of the file.
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        with open(log_path, "rb") as file:
+            _, self.block = update_index(log_path, file)
+        self.pending = []
+
+    def add(self, rows, lengths):
+        for row, length in zip(rows, lengths):
+            self.block.add(str(row[0]), length)
+            if self.block.rows == BLOCK_ROWS:
+                self.pending.append(self.block.entry())
+                self.block = Block(self.block.end)
+
+    def flush(self):
+        if self.pending:
+            with open(index_path(self.log_path), "a") as file:
+                file.write("".join(format_entry(entry) for entry in self.pending))
+            self.pending = []
@@ -1,13 +1,31 @@
-import os.path
-import csv
+import os
 from datetime import date
+from typing import Optional
 
 from fastapi import FastAPI, Query
 import uvicorn
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse, HTMLResponse
 
+import metrics
+from correlations import NightData, correlate, parse_windows
+from downsample import downsample_rows
+from journal_index import JournalIndex
+from night_cache import NightCache
+from rollups import RESOLUTIONS, Rollups, read_logs
+from storage import DEFAULT_DEVICE, open_storage, valid_device_id
+
 
 app = FastAPI()
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+# SLEEP_CACHE_MB bounds the memory used by parsed nights (default 64 MB)
+night_cache = NightCache(max_bytes=int(float(os.environ.get("SLEEP_CACHE_MB", "64")) * 1024 * 1024))
+storage = open_storage(os.environ.get("SLEEP_DATA_DIR", "sleep_data"), cache=night_cache)
+journal_index = JournalIndex(storage.root)
+
+metrics.instrument(app, "charting")
+for stat in ("entries", "bytes", "hits", "misses", "evictions"):
+    metrics.gauge(f"sleep_night_cache_{stat}", f"Parsed-night cache {stat}", lambda stat=stat: night_cache.stats()[stat])
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -15,60 +33,203 @@ def get_index() -> HTMLResponse:
     with open("static/index.html") as html:
         return HTMLResponse(content=html.read())
 
+def parse_time_bound(value: Optional[str]) -> Optional[str]:
+    # Accept "2025-05-24 23:00:00" or ISO "2025-05-24T23:00:00"
+    return value.replace("T", " ") if value else None
+
+def parse_devices(night: str, device: Optional[str]) -> Optional[list]:
+    # No device means the default one; otherwise a comma separated list or "all"
+    if device is None:
+        return None
+    devices = storage.devices(night) if device == "all" else device.split(",")
+    if not all(valid_device_id(d) for d in devices):
+        raise ValueError(f"Invalid device: {device}")
+    return devices
+
+def read_log(table: str, night: str, devices: Optional[list], start=None, end=None):
+    # Several devices are merged by timestamp, each row tagged with its device
+    if devices is None:
+        return storage.read(table, night, start, end)
+    if len(devices) == 1:
+        return storage.read(table, night, start, end, devices[0])
+    return storage.read_devices(table, night, devices, start, end)
+
+def device_error(error):
+    return JSONResponse(content={"error": str(error)}, status_code=422)
+
+# (night, device) -> (row counts and last timestamps, rollups) for nights without stored rollups
+backfilled = {}
+
+def device_rollups(night: str, device: str) -> Optional[Rollups]:
+    rollups = Rollups.from_json(storage.read_rollups(night, device))
+    if rollups is not None:
+        return rollups
+    logs = read_logs(storage, night, device)
+    if all(rows is None for rows in logs.values()):
+        return None
+    signature = tuple((len(rows), rows[-1]["timestamp"]) if rows else None for rows in logs.values())
+    cached = backfilled.get((night, device))
+    if cached is None or cached[0] != signature:
+        cached = backfilled[(night, device)] = (signature, Rollups.from_logs(logs))
+    return cached[1]
+
 @app.get("/sensorData")
-async def get_sensor_data(night: str = Query(default=str(date.today()))):
-    file_path = f"sleep_data/{night}/sensor_data_log.csv"
-    if not os.path.exists(file_path):
+async def get_sensor_data(night: str = Query(default=str(date.today())),
+                          start: Optional[str] = None,
+                          end: Optional[str] = None,
+                          max_points: Optional[int] = Query(default=None, ge=16),
+                          device: Optional[str] = None):
+    try:
+        devices = parse_devices(night, device)
+    except ValueError as e:
+        return device_error(e)
+    data = read_log("sensor_data", night, devices, parse_time_bound(start), parse_time_bound(end))
+    if data is None:
         return JSONResponse(content={"error": f"No data found for {night}."}, status_code=404)
-
-    with open(file_path, mode="r") as file:
-        reader = csv.DictReader(file)
-        data = [row for row in reader]
-    return data
+    return downsample_rows(data, max_points)
 
 @app.get("/sleepEvents")
-async def get_sleep_events(night: str = Query(default=str(date.today()))):
-    file_path = f"sleep_data/{night}/sleep_event_log.csv"
-    if not os.path.exists(file_path):
+async def get_sleep_events(night: str = Query(default=str(date.today())), device: Optional[str] = None):
+    try:
+        devices = parse_devices(night, device)
+    except ValueError as e:
+        return device_error(e)
+    data = read_log("sleep_events", night, devices)
+    if data is None:
         return JSONResponse(content={"error": "No sleep events found."}, status_code=404)
-
-    with open(file_path, mode="r") as file:
-        reader = csv.DictReader(file)
-        data = [row for row in reader]
     return data
 
 @app.get("/groundTruth")
-async def get_ground_truth(night: str = Query(default=str(date.today()))):
-    file_path = f"sleep_data/{night}/ground_truth_log.csv"
-    if not os.path.exists(file_path):
+async def get_ground_truth(night: str = Query(default=str(date.today())), device: Optional[str] = None):
+    try:
+        devices = parse_devices(night, device)
+    except ValueError as e:
+        return device_error(e)
+    data = read_log("ground_truth", night, devices)
+    if data is None:
         return JSONResponse(content={"error": "No ground truth found."}, status_code=404)
-
-    with open(file_path, mode="r") as file:
-        reader = csv.DictReader(file)
-        data = [row for row in reader]
     return data
+
+@app.get("/rollups")
+async def get_rollups(night: str = Query(default=str(date.today())),
+                      resolution: str = Query(default="15m", pattern=f"^({'|'.join(RESOLUTIONS)})$"),
+                      start: Optional[str] = None,
+                      end: Optional[str] = None,
+                      device: Optional[str] = None):
+    # Per-minute, per-15-minute or whole-night stats (count, min, max, sum, sumsq,
+    # mean per sensor column and counts per event type) without reading the raw logs
+    try:
+        devices = parse_devices(night, device) or [DEFAULT_DEVICE]
+    except ValueError as e:
+        return device_error(e)
+    merged = None
+    for name in devices:
+        rollups = device_rollups(night, name)
+        if rollups is not None:
+            merged = Rollups().merge(rollups) if merged is None else merged.merge(rollups)
+    if merged is None:
+        return JSONResponse(content={"error": f"No data found for {night}."}, status_code=404)
+    return {"night": night, "resolution": resolution, "devices": devices,
+            "buckets": merged.view(resolution, parse_time_bound(start), parse_time_bound(end))}
+
+# Loaded nights are rebuilt when a night lands or a journal changes; results are
+# kept per window/exclusion choice until then
+correlation_cache = {"signature": None, "data": None, "results": {}}
+
+@app.get("/correlations")
+async def get_correlations(windows: Optional[str] = None, exclude: Optional[str] = None):
+    # Pearson r (and p) of sensor window averages and event counts against journal
+    # latency and quality across nights. windows=onset,night,30m; exclude=night,night
+    try:
+        window_list = parse_windows(windows)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=422)
+    excluded = sorted({night for night in exclude.split(",") if night}) if exclude else []
+
+    nights = sorted(storage.available_nights())
+    journal_index.refresh()
+    signature = (tuple(nights), tuple((night, tuple(entry["signature"])) for night, entry in sorted(journal_index.entries.items())))
+    if correlation_cache["signature"] != signature:
+        correlation_cache.update(signature=signature, data=NightData(storage, journal_index, nights), results={})
+    key = (tuple(window_list), tuple(excluded))
+    results = correlation_cache["results"].get(key)
+    if results is None:
+        if len(correlation_cache["results"]) >= 32:
+            correlation_cache["results"].clear()
+        results = correlation_cache["results"][key] = correlate(correlation_cache["data"], window_list, excluded)
+    return {"windows": window_list, "exclude": excluded, "correlations": results}
+
 @app.get("/availableNights")
 async def get_available_nights():
-    return [name for name in os.listdir("sleep_data") if os.path.isdir(os.path.join("sleep_data", name))]
+    return storage.available_nights()
+
+@app.get("/devices")
+async def get_devices(night: str = Query(default=str(date.today()))):
+    return storage.devices(night)
 
 @app.get("/journal")
 async def get_journal(night: str):
-    file_path = f"sleep_data/{night}/journal.txt"
-    if not os.path.exists(file_path):
+    content = storage.read_journal(night)
+    if content is None:
         return JSONResponse(content={"error": "No journal found."}, status_code=404)
-    with open(file_path, mode='r') as file:
-        return file.read().replace('\n', ' ')
+    return content.replace('\n', ' ')
 
 @app.get("/melatonin")
 async def get_melatonin(night: str):
-    file_path = f"sleep_data/{night}/journal.txt"
-    if not os.path.exists(file_path):
+    if not journal_index.has_journal(night):
         return JSONResponse(content={"error": "No journal found."}, status_code=404)
-    with open(file_path, mode='r') as file:
-        content = file.read()
-        if "melatonin" in content:
-            return True
-        return False
+    return journal_index.mentions(night, "melatonin")
+
+@app.get("/journalSearch")
+async def search_journals(term: str):
+    # Nights whose journal mentions every word of term, case-insensitive
+    return {"term": term, "nights": journal_index.search(term)}
+
+@app.get("/nightSummary")
+async def get_night_summary(night: Optional[str] = None):
+    # Parsed journal fields (latency, quality, duration) and supplement flags,
+    # for one night or every night with a journal
+    if night is None:
+        return journal_index.summaries()
+    summary = journal_index.summary(night)
+    if summary is None:
+        return JSONResponse(content={"error": "No journal found."}, status_code=404)
+    return summary
+
+@app.get("/night/{night}")
+async def get_night(night: str, max_points: Optional[int] = Query(default=None, ge=16), device: Optional[str] = None):
+    # Everything the dashboard needs for one night in a single (gzipped) response
+    try:
+        devices = parse_devices(night, device)
+    except ValueError as e:
+        return device_error(e)
+    sensor_data = read_log("sensor_data", night, devices)
+    sleep_events = read_log("sleep_events", night, devices)
+    ground_truth = read_log("ground_truth", night, devices)
+    journal = storage.read_journal(night)
+    if sensor_data is None and sleep_events is None and ground_truth is None and journal is None:
+        return JSONResponse(content={"error": f"No data found for {night}."}, status_code=404)
+
+    return {
+        "night": night,
+        "devices": storage.devices(night),
+        "sensorData": downsample_rows(sensor_data or [], max_points),
+        "sleepEvents": sleep_events or [],
+        "groundTruth": ground_truth or [],
+        "journal": journal.replace('\n', ' ') if journal is not None else None,
+        "flags": {
+            "hasSensorData": bool(sensor_data),
+            "hasSleepEvents": bool(sleep_events),
+            "hasGroundTruth": ground_truth is not None and len(ground_truth) >= 2,
+            "hasJournal": journal is not None,
+            "melatonin": journal_index.mentions(night, "melatonin"),
+            "unisom": journal_index.mentions(night, "unisom"),
+        },
+    }
+
+@app.get("/cacheStats")
+async def get_cache_stats():
+    return night_cache.stats()
 
 if __name__ == "__main__":
 